@@ -0,0 +1,83 @@
+import hashlib
+import hmac
+
+import cache
+from config import settings
+from upstream import user_session
+
+# Record OCS /cloud/user được cache bao lâu (giây)
+USER_INFO_TTL = 60
+
+# Key để băm thông tin đăng nhập trước khi lưu vào cache dùng chung
+_DIGEST_KEY = hashlib.sha256(b"backend-credential-cache\0" + settings.NC_PASSWORD.encode()).digest()
+
+
+def credential_digest(username: str, password: str) -> str:
+    return hmac.new(_DIGEST_KEY, f"{username}\0{password}".encode("utf-8"), "sha256").hexdigest()
+
+
+def credentials_match(entry: dict, username: str, password: str) -> bool:
+    return entry is not None and hmac.compare_digest(
+        entry.get("digest", ""), credential_digest(username, password)
+    )
+
+
+def _key(username: str) -> str:
+    return f"userinfo:{username}"
+
+
+def fetch_user_info(username: str, password: str):
+    """
+    Lấy record OCS của user từ Nextcloud (bỏ qua cache) và lưu lại.
+    None nếu sai thông tin đăng nhập.
+    """
+    url = f"{settings.NEXTCLOUD_URL}/ocs/v1.php/cloud/user"
+    headers = {
+        "OCS-APIRequest": "true",
+        "Accept": "application/json"
+    }
+
+    r = user_session().get(url, auth=(username, password), headers=headers)
+
+    if r.status_code != 200 or "ocs" not in r.text:
+        return None
+
+    data = r.json()["ocs"]["data"]
+    cache.set(_key(username), {"digest": credential_digest(username, password), "data": data}, USER_INFO_TTL)
+    return data
+
+
+def get_user_info(username: str, password: str):
+    """
+    Record OCS của user, từ cache nếu có và đúng mật khẩu.
+    Record cache chỉ được trả cho đúng cặp username/password đã lấy nó.
+    """
+    entry = cache.get(_key(username))
+    if credentials_match(entry, username, password):
+        return entry["data"]
+    return fetch_user_info(username, password)
+
+
+def check_credentials(username: str, password: str) -> bool:
+    return get_user_info(username, password) is not None
+
+
+def update_cached(username: str, password: str, changes: dict, new_password: str = None):
+    """
+    Sửa record trong cache sau khi đổi thông tin thành công (changes: key của
+    record OCS -> giá trị mới). Đổi mật khẩu thì record chỉ còn khớp với mật khẩu mới.
+    """
+    entry = cache.get(_key(username))
+    if not credentials_match(entry, username, password):
+        return
+    if not changes and not new_password:
+        return
+
+    entry["data"].update(changes)
+    if new_password:
+        entry["digest"] = credential_digest(username, new_password)
+    cache.set(_key(username), entry, USER_INFO_TTL)
+
+
+def invalidate(username: str):
+    cache.delete(_key(username))
@@ -0,0 +1,178 @@
+import contextvars
+import csv
+import hmac
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from fastapi import APIRouter, Form, UploadFile, File
+from starlette.responses import JSONResponse, StreamingResponse
+
+from config import settings
+from plans import get_plans
+from upstream import admin_session, POOL_SIZE
+
+router = APIRouter()
+
+# Số user được tạo song song (không vượt quá số kết nối trong pool admin)
+BULK_CONCURRENCY = min(8, POOL_SIZE)
+MAX_BULK_USERS = 10000
+
+# Mã OCS v1 khi tạo user: 100 = OK, 102 = đã tồn tại, 103/108 = lỗi phía Nextcloud
+OCS_OK = 100
+OCS_RETRYABLE = {103, 108}
+
+USER_FIELDS = ["username", "password", "email", "displayname", "plan", "quota"]
+
+
+# -----------------------
+# Helpers
+# -----------------------
+def check_admin_key(admin_key: str):
+    if not settings.ADMIN_API_KEY:
+        return JSONResponse(status_code=403, content={"error": "Admin API is disabled"})
+    if not hmac.compare_digest(admin_key.encode(), settings.ADMIN_API_KEY.encode()):
+        return JSONResponse(status_code=403, content={"error": "Invalid admin key"})
+    return None
+
+
+def parse_users(raw: str, filename: str = "") -> list:
+    """
+    JSON: [{"username": ..., "password": ..., ...}, ...]
+    CSV: dòng đầu là header, cột: username,password,email,displayname,plan,quota
+    """
+    text = raw.lstrip("\ufeff").strip()
+    if filename.lower().endswith(".json") or text.startswith("["):
+        data = json.loads(text)
+        if not isinstance(data, list) or not all(isinstance(row, dict) for row in data):
+            raise ValueError("JSON must be a list of objects")
+        rows = data
+    else:
+        rows = list(csv.DictReader(io.StringIO(text)))
+
+    return [
+        {field: str(row[field]).strip() for field in USER_FIELDS if row.get(field) not in (None, "")}
+        for row in rows
+    ]
+
+
+def ocs_status(resp):
+    try:
+        meta = resp.json()["ocs"]["meta"]
+        return meta.get("statuscode"), meta.get("message") or resp.text
+    except (ValueError, KeyError, TypeError):
+        return None, resp.text
+
+
+def provision_user(row: dict) -> dict:
+    username = row.get("username")
+    result = {"username": username}
+
+    if not username or not row.get("password"):
+        return {**result, "status": "error", "error": "username and password are required", "retry": False}
+
+    new_quota = row.get("quota")
+    if row.get("plan"):
+        plan = get_plans().get(row["plan"])
+        if plan is None:
+            return {**result, "status": "error", "error": f"Unknown plan {row['plan']}", "retry": False}
+        new_quota = plan["quota"]
+
+    session = admin_session()
+    url = f"{settings.NEXTCLOUD_URL}/ocs/v1.php/cloud/users"
+
+    payload = {"userid": username, "password": row["password"], "format": "json"}
+    if row.get("email"):
+        payload["email"] = row["email"]
+    if row.get("displayname"):
+        payload["displayName"] = row["displayname"]
+
+    try:
+        r = session.post(url, data=payload, timeout=30)
+        status, message = ocs_status(r)
+        if r.status_code >= 500 or (status is None and r.status_code not in (200, 201)):
+            return {**result, "status": "error", "error": message, "retry": True}
+        if status != OCS_OK:
+            return {**result, "status": "error", "error": message, "retry": status in OCS_RETRYABLE}
+
+        if new_quota:
+            r = session.put(
+                f"{url}/{username}",
+                data={"key": "quota", "value": new_quota, "format": "json"},
+                timeout=30
+            )
+            status, message = ocs_status(r)
+            if status != OCS_OK:
+                # User đã được tạo: chỉ cần chạy lại bước quota
+                return {**result, "status": "created", "quota_error": message, "retry": True}
+    except requests.RequestException as e:
+        return {**result, "status": "error", "error": str(e), "retry": True}
+
+    return {**result, "status": "created", "quota": new_quota}
+
+
+# -----------------------
+# BULK REGISTER
+# -----------------------
+@router.post("/bulk-register")
+def bulk_register(
+        admin_key: str = Form(...),
+        file: UploadFile = File(None),
+        users: str = Form(None)
+):
+    """
+    Tạo nhiều user một lần: file CSV/JSON hoặc field `users` (JSON).
+    Trả về NDJSON, mỗi dòng là kết quả của một user (theo thứ tự hoàn thành),
+    dòng cuối là tổng kết. User có "retry": true có thể gửi lại.
+    """
+    denied = check_admin_key(admin_key)
+    if denied:
+        return denied
+
+    if file is None and not users:
+        return JSONResponse(status_code=400, content={"error": "Provide a CSV/JSON file or a users field"})
+
+    try:
+        if file is not None:
+            rows = parse_users(file.file.read().decode("utf-8"), file.filename or "")
+        else:
+            rows = parse_users(users, ".json")
+    except (ValueError, csv.Error) as e:
+        return JSONResponse(status_code=400, content={"error": f"Cannot parse users: {e}"})
+
+    if len(rows) > MAX_BULK_USERS:
+        return JSONResponse(status_code=413, content={"error": f"At most {MAX_BULK_USERS} users per request"})
+
+    seen = set()
+    duplicates = []
+    unique_rows = []
+    for row in rows:
+        username = row.get("username")
+        # Dòng thiếu username không tính trùng: provision_user báo lỗi cho từng dòng
+        if username and username in seen:
+            duplicates.append(username)
+            continue
+        if username:
+            seen.add(username)
+        unique_rows.append(row)
+
+    def results():
+        created = failed = 0
+        for username in duplicates:
+            failed += 1
+            yield json.dumps({"username": username, "status": "error", "error": "Duplicate in input", "retry": False}) + "\n"
+
+        with ThreadPoolExecutor(max_workers=BULK_CONCURRENCY) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, provision_user, row) for row in unique_rows]
+            for future in as_completed(futures):
+                result = future.result()
+                if result["status"] == "created":
+                    created += 1
+                else:
+                    failed += 1
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+
+        yield json.dumps({"status": "done", "created": created, "failed": failed}) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
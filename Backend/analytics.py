@@ -0,0 +1,346 @@
+import atexit
+import bisect
+import logging
+import os
+import threading
+import time
+import uuid
+from email.utils import parsedate_to_datetime
+from threading import Lock
+
+import cache
+
+# Thống kê dung lượng theo user, cập nhật dần từ các PROPFIND backend đã nhận
+# (list-files, dashboard...) và từ các thao tác upload / xóa / move / copy.
+# Không crawl cả cây thư mục: chỉ những folder đã từng được liệt kê mới có số liệu.
+#
+# Mỗi user một dòng trong cache dùng chung (cache.py, SQLite/Redis):
+#   analytics:<user>      {"rev", "entries"}
+#   analytics-rev:<user>  rev, nhỏ để kiểm tra rẻ xem worker khác đã ghi chưa
+# Worker giữ bản đã dựng (các sorted list) trong bộ nhớ, nạp lại khi rev đổi.
+# Thread nền ghi các user đã đổi mỗi SAVE_INTERVAL giây (và khi tắt process),
+# không ghi trên thread xử lý request. Hai worker cùng sửa một user trong
+# cùng khoảng đó thì bản ghi sau thắng; PROPFIND kế tiếp sẽ sửa lại số liệu.
+ANALYTICS_TTL = 30 * 24 * 3600
+
+SAVE_INTERVAL = 5
+
+TOP_N = 10
+
+logger = logging.getLogger("analytics")
+
+_users = {}
+_lock = Lock()
+_writer_pid = None
+
+
+def _timestamp(last_modified):
+    if not last_modified:
+        return 0.0
+    try:
+        return parsedate_to_datetime(last_modified).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _parent(path: str) -> str:
+    parent = path.rstrip("/").rpartition("/")[0]
+    return parent or "/"
+
+
+def _insort(items: list, item):
+    bisect.insort(items, item)
+
+
+def _discard(items: list, item):
+    i = bisect.bisect_left(items, item)
+    if i < len(items) and items[i] == item:
+        del items[i]
+
+
+class _UserStats:
+    """
+    entries: path -> {"size", "type", "last_modified", "folder"}
+    Các tổng hợp được giữ sẵn (sorted list / dict) để đọc ra không phải quét lại.
+    """
+
+    def __init__(self, rev: str = None):
+        self.rev = rev
+        self.dirty = False
+        self.entries = {}
+        self.children = {}
+        self.by_type = {}
+        self.files_by_size = []
+        self.files_by_mtime = []
+        self.folders_by_size = []
+        self.total_files = 0
+        self.total_bytes = 0
+
+    def put(self, path: str, entry: dict):
+        old = self.entries.get(path)
+        if old == entry:
+            return False
+        if old is not None:
+            self._drop(path, old)
+
+        self.entries[path] = entry
+        self.children.setdefault(_parent(path), set()).add(path)
+
+        if entry["folder"]:
+            if entry["size"] is not None:
+                _insort(self.folders_by_size, (entry["size"], path))
+            return True
+
+        size = entry["size"]
+        stats = self.by_type.setdefault(entry["type"], [0, 0])
+        stats[0] += 1
+        stats[1] += size
+        self.total_files += 1
+        self.total_bytes += size
+        _insort(self.files_by_size, (size, path))
+        _insort(self.files_by_mtime, (_timestamp(entry["last_modified"]), path))
+        return True
+
+    def _drop(self, path: str, entry: dict):
+        del self.entries[path]
+        siblings = self.children.get(_parent(path))
+        if siblings is not None:
+            siblings.discard(path)
+
+        if entry["folder"]:
+            if entry["size"] is not None:
+                _discard(self.folders_by_size, (entry["size"], path))
+            return
+
+        size = entry["size"]
+        stats = self.by_type[entry["type"]]
+        stats[0] -= 1
+        stats[1] -= size
+        if stats[0] == 0:
+            del self.by_type[entry["type"]]
+        self.total_files -= 1
+        self.total_bytes -= size
+        _discard(self.files_by_size, (size, path))
+        _discard(self.files_by_mtime, (_timestamp(entry["last_modified"]), path))
+
+    def load(self, entries: dict):
+        # Nạp từ cache: thêm hết rồi sort một lần thay vì insort từng entry
+        for path, entry in entries.items():
+            self.entries[path] = entry
+            self.children.setdefault(_parent(path), set()).add(path)
+            if entry["folder"]:
+                if entry["size"] is not None:
+                    self.folders_by_size.append((entry["size"], path))
+                continue
+            stats = self.by_type.setdefault(entry["type"], [0, 0])
+            stats[0] += 1
+            stats[1] += entry["size"]
+            self.total_files += 1
+            self.total_bytes += entry["size"]
+            self.files_by_size.append((entry["size"], path))
+            self.files_by_mtime.append((_timestamp(entry["last_modified"]), path))
+
+        self.files_by_size.sort()
+        self.files_by_mtime.sort()
+        self.folders_by_size.sort()
+
+    def remove_tree(self, path: str) -> dict:
+        """
+        Xóa path và mọi thứ bên dưới, trả về {path: entry} đã xóa.
+        """
+        removed = {}
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            stack.extend(self.children.pop(current, ()))
+            entry = self.entries.get(current)
+            if entry is not None:
+                self._drop(current, entry)
+                removed[current] = entry
+        return removed
+
+    def summary(self) -> dict:
+        by_type = sorted(
+            ({"type": t, "count": c, "bytes": b} for t, (c, b) in self.by_type.items()),
+            key=lambda item: item["bytes"],
+            reverse=True
+        )
+        return {
+            "files": self.total_files,
+            "bytes": self.total_bytes,
+            "by_type": by_type,
+            "largest_files": [
+                {"path": path, "size": size}
+                for size, path in reversed(self.files_by_size[-TOP_N:])
+            ],
+            "largest_folders": [
+                {"path": path, "size": size}
+                for size, path in reversed(self.folders_by_size[-TOP_N:])
+            ],
+            "recent_files": [
+                {"path": path, "last_modified": self.entries[path]["last_modified"]}
+                for _, path in reversed(self.files_by_mtime[-TOP_N:])
+            ],
+        }
+
+
+def _entry_from_dav(item: dict) -> dict:
+    if item["is_folder"]:
+        return {"size": item["oc_size"], "type": "folder", "last_modified": item["last_modified"], "folder": True}
+    return {
+        "size": item["size"],
+        "type": item["type"] or "application/octet-stream",
+        "last_modified": item["last_modified"],
+        "folder": False,
+    }
+
+
+def _data_key(username: str) -> str:
+    return f"analytics:{username}"
+
+
+def _rev_key(username: str) -> str:
+    return f"analytics-rev:{username}"
+
+
+def _user(username: str) -> _UserStats:
+    stats = _users.get(username)
+    if stats is not None and (stats.dirty or cache.get(_rev_key(username)) == stats.rev):
+        return stats
+
+    stats = _users[username] = _UserStats()
+    data = cache.get(_data_key(username))
+    if data is not None:
+        stats.rev = data["rev"]
+        stats.load(data["entries"])
+    return stats
+
+
+def _changed(stats: _UserStats):
+    global _writer_pid
+    stats.dirty = True
+    # Thread không đi theo fork (gunicorn preload): tạo lại trong process con
+    if _writer_pid != os.getpid():
+        _writer_pid = os.getpid()
+        threading.Thread(target=_write_loop, name="analytics-writer", daemon=True).start()
+
+
+def _write_loop():
+    while True:
+        time.sleep(SAVE_INTERVAL)
+        try:
+            flush()
+        except Exception:
+            logger.exception("cannot save analytics")
+
+
+@atexit.register
+def flush():
+    with _lock:
+        pending = []
+        for username, stats in _users.items():
+            if stats.dirty:
+                stats.dirty = False
+                # Entry không bị sửa tại chỗ (put thay cả dict) nên copy nông là đủ
+                pending.append((username, stats, uuid.uuid4().hex, dict(stats.entries)))
+
+    for username, stats, rev, entries in pending:
+        try:
+            cache.set(_data_key(username), {"rev": rev, "entries": entries}, ANALYTICS_TTL)
+            cache.set(_rev_key(username), rev, ANALYTICS_TTL)
+        except Exception:
+            with _lock:
+                stats.dirty = True
+            raise
+        with _lock:
+            stats.rev = rev
+
+
+def observe_listing(username: str, folder: str, folder_entry, entries: list):
+    """
+    Cập nhật từ một PROPFIND Depth 1 (xem webdav.parse_listing).
+    Entry con không còn trong listing -> xóa (kể cả các entry bên dưới nó).
+    """
+    folder = "/" + folder.strip("/")
+    with _lock:
+        stats = _user(username)
+        changed = False
+
+        if folder_entry is not None and folder != "/":
+            changed |= stats.put(folder, _entry_from_dav(folder_entry))
+
+        seen = set()
+        for item in entries:
+            seen.add(item["path"])
+            changed |= stats.put(item["path"], _entry_from_dav(item))
+
+        for path in list(stats.children.get(folder, ())):
+            if path not in seen:
+                stats.remove_tree(path)
+                changed = True
+
+        if changed:
+            _changed(stats)
+
+
+def record_file(username: str, path: str, size: int, content_type: str):
+    with _lock:
+        stats = _user(username)
+        stats.put(path, {
+            "size": size,
+            "type": content_type or "application/octet-stream",
+            "last_modified": time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime()),
+            "folder": False,
+        })
+        _changed(stats)
+
+
+def remove(username: str, path: str):
+    """
+    Xóa path khỏi thống kê. Trả về số byte đã giải phóng nếu biết chắc, ngược lại None.
+    """
+    with _lock:
+        stats = _user(username)
+        entry = stats.entries.get(path)
+        removed = stats.remove_tree(path)
+        if removed:
+            _changed(stats)
+
+    if entry is None or entry["size"] is None:
+        return None
+    return entry["size"]
+
+
+def move(username: str, source: str, destination: str, keep_source: bool = False):
+    """
+    Đổi key cả cây source -> destination (copy nếu keep_source=True).
+    Trả về kích thước của source nếu biết, ngược lại None.
+    """
+    with _lock:
+        stats = _user(username)
+        entry = stats.entries.get(source)
+        stats.remove_tree(destination)
+
+        if keep_source:
+            subtree = {}
+            stack = [source]
+            while stack:
+                current = stack.pop()
+                stack.extend(stats.children.get(current, ()))
+                if current in stats.entries:
+                    subtree[current] = dict(stats.entries[current])
+        else:
+            subtree = stats.remove_tree(source)
+
+        for path, item in subtree.items():
+            stats.put(destination + path[len(source):], item)
+        _changed(stats)
+
+    if entry is None or entry["size"] is None:
+        return None
+    return entry["size"]
+
+
+def summary(username: str) -> dict:
+    with _lock:
+        return _user(username).summary()
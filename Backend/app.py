@@ -1,28 +1,101 @@
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
+import asyncio
 import datetime
 import json
+import logging
 import os
-import string
-import time
+import signal
+import tempfile
+import threading
 import urllib
-import xml.etree.ElementTree as ET
-import random
+from contextlib import asynccontextmanager
 from threading import Lock
 
-from fastapi import FastAPI, UploadFile, File, Form, Request, HTTPException
+from fastapi import FastAPI, Form, Request, HTTPException, Depends
 from fastapi.responses import JSONResponse
+from fastapi.security import HTTPBasic, HTTPBasicCredentials
 import requests
+from starlette.concurrency import run_in_threadpool
 from starlette.responses import PlainTextResponse, StreamingResponse
 
+import accounts
+import analytics
+import changefeed
+import content_cache
+import ids
+import listings
+import logs
+import quota
+from admin import users as admin_users
 from auth import user
 from sharing import share
 from config import settings
+from http_cache import json_response
+from metrics import rss_bytes, format_mb
+from payment_providers import get_provider, enabled_providers, unknown_providers
+from plans import get_plans
+from upstream import admin_session, user_session, gateway_session, check_ready
+from uploads import MultipartStream, UploadError, MAX_FIELD_SIZE, MAX_MANIFEST_SIZE, clean_relative_path
+from webdav import dav_url, put_stream, parent_folder, FolderMaker, DavError, propfind, parse_listing
 from fastapi.middleware.cors import CORSMiddleware
 
-from momo import create_momo_signature
-from vnpay import create_vnpay_signature
-from zalopay import generate_mac
+logs.setup()
+logger = logging.getLogger("app")
+
+
+def _start_draining():
+    app.state.draining = True
+    changefeed.close_all()
 
-app = FastAPI()
+
+def _hook_shutdown_signals():
+    """
+    Bọc handler SIGTERM/SIGINT của uvicorn (đã cài trước lifespan): đánh dấu
+    draining và đóng các stream SSE ngay khi nhận tín hiệu.
+    Với SIGTERM, worker vẫn nhận request thêm SHUTDOWN_DRAIN_DELAY giây
+    (/ready trả 503 để load balancer rút worker ra) rồi mới để uvicorn
+    ngừng nhận kết nối và chờ request dở dang.
+    """
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            continue
+
+        def handler(signum, frame, previous=previous):
+            delay = settings.SHUTDOWN_DRAIN_DELAY if signum == signal.SIGTERM else 0
+            if app.state.draining or delay <= 0:
+                loop.call_soon_threadsafe(_start_draining)
+                previous(signum, frame)
+                return
+            loop.call_soon_threadsafe(_start_draining)
+            loop.call_soon_threadsafe(loop.call_later, delay, previous, signum, None)
+
+        signal.signal(sig, handler)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("startup", extra={
+        "pid": os.getpid(),
+        "import_ms": round(IMPORT_MS, 1),
+        "rss": format_mb(rss_bytes()),
+        "payment_providers": enabled_providers(),
+    })
+    if unknown_providers():
+        logger.warning("ignoring unknown payment providers", extra={"providers": unknown_providers()})
+    if threading.current_thread() is threading.main_thread():
+        _hook_shutdown_signals()
+    yield
+    _start_draining()
+    logs.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+app.state.draining = False
 
 app.add_middleware(
     CORSMiddleware,
@@ -30,16 +103,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # ETag: để JS đọc được và gửi lại qua If-None-Match
+    expose_headers=["X-Request-ID", "ETag"],
 )
 
+app.add_middleware(logs.RequestLogMiddleware, sample_rates=logs.parse_sample_rates(settings.LOG_SAMPLE_RATES))
+
 app.include_router(share.router, prefix="/share", tags=["share"])
 app.include_router(user.router, prefix="/auth", tags=["auth"])
-
-with open("plans.json", "r", encoding="utf-8") as f:
-    PLANS = json.load(f)["plans"]
+app.include_router(admin_users.router, prefix="/admin", tags=["admin"])
 
 Payment_file = "payments.json"
 
+# Số PUT chạy song song trong một request /upload-many
+UPLOAD_PARALLELISM = 4
+
 
 @app.get("/")
 def home():
@@ -52,34 +130,40 @@ def home():
 @app.post("/register")
 def register(username: str = Form(...), password: str = Form(...)):
     url = f"{settings.NEXTCLOUD_URL}/ocs/v1.php/cloud/users"
-    headers = {
-        "OCS-APIRequest": "true"
-    }
 
     payload = {"userid": username, "password": password, "format": "json"}
-    auth = (settings.NC_USERNAME, settings.NC_PASSWORD)
 
-    r = requests.post(url, auth=auth, headers=headers, data=payload)
+    r = admin_session().post(url, data=payload)
 
     if r.status_code in [200, 201]:
         return {"message": f"User {username} created successfully!"}
     return JSONResponse(status_code=400, content={"error": r.text})
 
 
+# -----------------------
+# READINESS
+# -----------------------
+@app.get("/ready")
+def ready():
+    """
+    Cho load balancer: 200 khi worker nhận request được và Nextcloud trả lời
+    qua pool kết nối dùng chung, 503 khi đang tắt hoặc Nextcloud không sẵn sàng.
+    """
+    if app.state.draining:
+        return JSONResponse(status_code=503, content={"status": "draining", "pid": os.getpid()})
+
+    upstream = check_ready()
+    if not upstream["ok"]:
+        return JSONResponse(status_code=503, content={"status": "unavailable", "pid": os.getpid(), "nextcloud": upstream})
+    return {"status": "ready", "pid": os.getpid(), "nextcloud": upstream}
+
+
 # -----------------------
 # LOGIN USER
 # -----------------------
 @app.post("/login")
 def login(username: str = Form(...), password: str = Form(...)):
-    auth = (username, password)
-    url = f"{settings.NEXTCLOUD_URL}/ocs/v1.php/cloud/user"
-    headers = {
-        "OCS-APIRequest": "true"
-    }
-
-    r = requests.get(url, auth=auth, headers=headers)
-
-    if r.status_code == 200:
+    if accounts.check_credentials(username, password):
         return {"message": "Login successful"}
     return JSONResponse(status_code=401, content={"error": "Invalid credentials"})
 
@@ -88,21 +172,296 @@ def login(username: str = Form(...), password: str = Form(...)):
 # UPLOAD FILE
 # -----------------------
 @app.post("/upload")
-async def upload_to_nextcloud(file: UploadFile = File(...), username: str = Form(...), password: str = Form(...)):
-    upload_url = f"{settings.NEXTCLOUD_URL}/remote.php/dav/files/{username}/{file.filename}"
-    data = await file.read()
+async def upload_to_nextcloud(request: Request):
+    """
+    multipart/form-data: username, password, file.
+    Nếu username/password đứng TRƯỚC file trong form thì quota được kiểm tra
+    trước khi đọc byte nào của file, và file được stream thẳng lên Nextcloud.
+    Ngược lại file được tạm lưu rồi mới kiểm tra + upload.
+    """
+    try:
+        form = MultipartStream(request)
+        fields = {}
+        spooled = None
+
+        async for part in form.parts():
+            if part.filename is None:
+                fields[part.name] = (await part.read()).decode("utf-8")
+                continue
+            if part.name != "file" or spooled is not None:
+                continue
+
+            if "username" in fields and "password" in fields:
+                return await _stream_upload(form, part, fields["username"], fields["password"])
+
+            spooled = (part.filename, part.content_type, await _spool(part))
+
+        if spooled is None or "username" not in fields or "password" not in fields:
+            return JSONResponse(status_code=400, content={"error": "username, password and file are required"})
+
+        return await _spooled_upload(fields["username"], fields["password"], *spooled)
+    except UploadError as e:
+        return JSONResponse(status_code=e.status_code, content={"error": e.message})
+
+
+async def _spool(part):
+    tmp = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    async for chunk in part.chunks():
+        await run_in_threadpool(tmp.write, chunk)
+    return tmp
+
+
+async def _stream_upload(form, part, username: str, password: str):
+    auth = (username, password)
+
+    # Content-Length của cả request là cận trên của kích thước file
+    fits, free = await run_in_threadpool(quota.check_fits, username, auth, form.content_length or 0)
+    if fits is None:
+        return JSONResponse(status_code=401, content={"error": "Invalid credentials"})
+    if not fits:
+        return JSONResponse(
+            status_code=507,
+            content={"error": "Not enough storage", "free": free, "required": form.content_length}
+        )
+
+    received = 0
+    rechecked = False
+
+    async def counted_chunks():
+        nonlocal received, free, rechecked
+        async for chunk in part.chunks():
+            received += len(chunk)
+            if free is not None and received > free:
+                # Lấy lại quota một lần trước khi hủy, phòng khi cache đã cũ
+                if not rechecked:
+                    rechecked = True
+                    record = await run_in_threadpool(quota.fetch, username, auth)
+                    if record is not None:
+                        free = quota.free_bytes(record)
+                if free is not None and received > free:
+                    raise quota.QuotaExceeded()
+            yield chunk
+
+    try:
+        r = await put_stream(
+            dav_url(username, part.filename),
+            counted_chunks(),
+            headers={"Content-Type": part.content_type},
+            auth=auth
+        )
+    except quota.QuotaExceeded:
+        return JSONResponse(status_code=507, content={"error": "Not enough storage", "free": free})
+
+    return await _upload_result(r, username, part.filename, part.content_type, received)
 
-    headers = {
-        "Content-Type": file.content_type
-    }
 
-    r = requests.put(upload_url, data=data, headers=headers, auth=(username, password))
+async def _spooled_upload(username: str, password: str, filename: str, content_type: str, tmp):
+    auth = (username, password)
+
+    with tmp:
+        size = tmp.seek(0, os.SEEK_END)
+        tmp.seek(0)
+
+        fits, free = await run_in_threadpool(quota.check_fits, username, auth, size)
+        if fits is None:
+            return JSONResponse(status_code=401, content={"error": "Invalid credentials"})
+        if not fits:
+            return JSONResponse(
+                status_code=507,
+                content={"error": "Not enough storage", "free": free, "required": size}
+            )
+
+        headers = {
+            "Content-Type": content_type
+        }
+
+        r = await run_in_threadpool(
+            user_session().put, dav_url(username, filename), data=tmp, headers=headers, auth=auth
+        )
+
+    return await _upload_result(r, username, filename, content_type, size)
+
 
+async def _upload_result(r, username: str, filename: str, content_type: str, size: int):
     if r.status_code in [200, 201, 204]:
-        return {"status": "success", "file": file.filename}
+        # Ghi cache / analytics có thể chạm Redis, SQLite: không chạy trên event loop
+        await run_in_threadpool(quota.consume, username, size)
+        await run_in_threadpool(analytics.record_file, username, f"/{filename}", size, content_type)
+        return {"status": "success", "file": filename}
+
+    if r.status_code == 507:
+        await run_in_threadpool(quota.invalidate, username)
     return JSONResponse(status_code=400, content={"error": r.text})
 
 
+# -----------------------
+# UPLOAD MANY FILES / FOLDER
+# -----------------------
+@app.post("/upload-many")
+async def upload_many(request: Request):
+    """
+    multipart/form-data, theo thứ tự:
+    - username, password
+    - target (tùy chọn): folder đích, mặc định "/"
+    - paths (tùy chọn): JSON list đường dẫn tương đối của từng file, theo thứ tự file.
+      Có paths thì toàn bộ folder được MKCOL ngay, song song với việc nhận file.
+    - files: nhiều part, filename = đường dẫn tương đối (vd: "photos/2024/a.jpg")
+    Trả về NDJSON: một dòng cho mỗi file khi upload xong, dòng cuối là tổng kết.
+    File có đường dẫn không hợp lệ được bỏ qua (một dòng lỗi), các file khác vẫn upload.
+    """
+    jobs = []
+    folders = None
+    try:
+        form = MultipartStream(request)
+        fields = {}
+        manifest = None
+        target = "/"
+        free = None
+        received = 0
+        files = 0
+        errors = []
+        quota_error = None
+        slots = asyncio.Semaphore(UPLOAD_PARALLELISM)
+
+        async for part in form.parts():
+            if part.filename is None:
+                limit = MAX_MANIFEST_SIZE if part.name == "paths" else MAX_FIELD_SIZE
+                fields[part.name] = (await part.read(limit)).decode("utf-8")
+                if part.name == "paths":
+                    manifest = _parse_manifest(fields["paths"])
+                continue
+            if part.name != "files":
+                continue
+
+            if folders is None:
+                if "username" not in fields or "password" not in fields:
+                    raise UploadError(400, "username and password must come before files")
+
+                username, auth = fields["username"], (fields["username"], fields["password"])
+                fits, free = await run_in_threadpool(
+                    quota.check_fits, username, auth, form.content_length or 0
+                )
+                if fits is None:
+                    return JSONResponse(status_code=401, content={"error": "Invalid credentials"})
+                if not fits:
+                    return JSONResponse(
+                        status_code=507,
+                        content={"error": "Not enough storage", "free": free, "required": form.content_length}
+                    )
+
+                target = share.normalize_path(username, fields.get("target") or "/").rstrip("/")
+                folders = FolderMaker(username, auth)
+                # Tạo trước toàn bộ cây folder, cha trước con, trong lúc file còn đang tới
+                for relpath in manifest or []:
+                    folders.ensure(parent_folder(f"{target}/{relpath}"))
+
+            index, files = files, files + 1
+            try:
+                relpath = manifest[index] if manifest and index < len(manifest) else clean_relative_path(part.filename)
+            except UploadError as e:
+                errors.append({"path": part.filename, "error": e.message})
+                continue
+            path = f"{target}/{relpath}"
+
+            tmp = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+            size = 0
+            try:
+                async for chunk in part.chunks():
+                    size += len(chunk)
+                    if free is not None and received + size > free:
+                        quota_error = {"path": path, "error": "Not enough storage", "free": free}
+                        break
+                    await run_in_threadpool(tmp.write, chunk)
+            except BaseException:
+                tmp.close()
+                raise
+            if quota_error:
+                tmp.close()
+                errors.append(quota_error)
+                break
+
+            received += size
+            tmp.seek(0)
+            jobs.append(asyncio.ensure_future(
+                _put_one(slots, folders, username, auth, path, tmp, size, part.content_type)
+            ))
+
+        if folders is None:
+            return JSONResponse(status_code=400, content={"error": "username, password and files are required"})
+    except BaseException as e:
+        # Body hỏng giữa chừng: không để các PUT / MKCOL đã bắt đầu chạy mồ côi
+        await _abort_uploads(jobs, folders)
+        if isinstance(e, UploadError):
+            return JSONResponse(status_code=e.status_code, content={"error": e.message})
+        raise
+
+    async def results():
+        uploaded = failed = 0
+        for done, job in enumerate(asyncio.as_completed(jobs), start=1):
+            result = await job
+            if result["status"] == "success":
+                uploaded += 1
+            else:
+                failed += 1
+            yield json.dumps({**result, "completed": done, "total": len(jobs)}, ensure_ascii=False) + "\n"
+
+        for error in errors:
+            failed += 1
+            yield json.dumps({"status": "error", **error}, ensure_ascii=False) + "\n"
+
+        await folders.wait_all()
+        yield json.dumps({"status": "done", "uploaded": uploaded, "failed": failed}) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+def _parse_manifest(raw: str) -> list:
+    try:
+        paths = json.loads(raw)
+    except json.JSONDecodeError:
+        raise UploadError(400, "paths must be a JSON list")
+    if not isinstance(paths, list) or not all(isinstance(p, str) for p in paths):
+        raise UploadError(400, "paths must be a JSON list")
+    return [clean_relative_path(p) for p in paths]
+
+
+async def _abort_uploads(jobs: list, folders):
+    """
+    Hủy các file chưa bắt đầu PUT và chờ các PUT / MKCOL đang chạy xong
+    (thread không dừng giữa chừng được), để file tạm đều được đóng.
+    """
+    for job in jobs:
+        job.cancel()
+    if jobs:
+        await asyncio.gather(*jobs, return_exceptions=True)
+    if folders is not None:
+        await folders.wait_all()
+
+
+async def _put_one(slots, folders, username: str, auth, path: str, tmp, size: int, content_type: str):
+    try:
+        async with slots:
+            await folders.ensure(parent_folder(path))
+            r = await run_in_threadpool(
+                user_session().put, dav_url(username, path), data=tmp, headers={"Content-Type": content_type}, auth=auth
+            )
+    except DavError as e:
+        return {"status": "error", "path": path, "error": e.message}
+    except requests.RequestException as e:
+        return {"status": "error", "path": path, "error": str(e)}
+    finally:
+        tmp.close()
+
+    if r.status_code in [200, 201, 204]:
+        await run_in_threadpool(quota.consume, username, size)
+        await run_in_threadpool(analytics.record_file, username, path, size, content_type)
+        return {"status": "success", "path": path, "bytes": size}
+
+    if r.status_code == 507:
+        await run_in_threadpool(quota.invalidate, username)
+    return {"status": "error", "path": path, "error": r.text}
+
+
 # -----------------------
 # PAYMENT (FAKE)
 # -----------------------
@@ -116,25 +475,20 @@ def payment(username: str = Form(...), amount: float = Form(...)):
 # -----------------------
 @app.post("/quota")
 def get_quota(username: str = Form(...), password: str = Form(...)):
-    auth = (username, password)
-    url = f"{settings.NEXTCLOUD_URL}/ocs/v1.php/cloud/user"
-    headers = {
-        "OCS-APIRequest": "true",
-        "Accept": "application/json"
-    }
-
-    r = requests.get(url, auth=auth, headers=headers)
+    # Luôn lấy số liệu mới từ Nextcloud (đồng thời làm mới cache user info)
+    user_data = accounts.fetch_user_info(username, password)
 
-    if r.status_code != 200 or "ocs" not in r.text:
+    if user_data is None:
         return JSONResponse(status_code=401, content={"error": "Invalid credentials"})
 
-    quota = r.json()["ocs"]["data"]["quota"]
+    user_quota = user_data["quota"]
+    quota.remember(username, user_quota)
 
     return {
-        "used": quota["used"],
-        "available": quota["free"],
-        "total": quota["quota"],
-        "relative": quota.get("relative", 0)
+        "used": user_quota["used"],
+        "available": user_quota["free"],
+        "total": user_quota["quota"],
+        "relative": user_quota.get("relative", 0)
     }
 
 
@@ -142,112 +496,123 @@ def get_quota(username: str = Form(...), password: str = Form(...)):
 # DASHBOARD API
 # -----------------------
 @app.post("/dashboard")
-def get_dashboard(username: str = Form(...), password: str = Form(...)):
+def get_dashboard(request: Request, username: str = Form(...), password: str = Form(...)):
     auth = (username, password)
 
-    user_url = f"{settings.NEXTCLOUD_URL}/ocs/v1.php/cloud/user"
-    headers = {
-        "OCS-APIRequest": "true",
-        "Accept": "application/json"
-    }
-
-    user_info = requests.get(user_url, auth=auth, headers=headers)
+    user_data = accounts.fetch_user_info(username, password)
 
-    if user_info.status_code != 200 or "ocs" not in user_info.text:
+    if user_data is None:
         return JSONResponse(status_code=401, content={"error": "Invalid credentials"})
 
-    user_data = user_info.json()["ocs"]["data"]
-    quota = user_data["quota"]
-
-    dav_url = f"{settings.NEXTCLOUD_URL}/remote.php/dav/files/{username}/"
-    dav_headers = {
-        "Depth": "1",
-        "Content-Type": "application/xml"
-    }
-
-    propfind_body = """
-        <d:propfind xmlns:d="DAV:">
-            <d:prop>
-                <d:getcontentlength />
-            </d:prop>
-        </d:propfind>
-    """
+    user_quota = user_data["quota"]
+    quota.remember(username, user_quota)
 
-    dav_response = requests.request("PROPFIND", dav_url, data=propfind_body, headers=dav_headers, auth=auth)
+    dav_response = propfind(username, auth)
 
     file_count = 0
     if dav_response.status_code == 207:
-        root = ET.fromstring(dav_response.text)
-        file_count = len(root.findall("{DAV:}response")) - 1  # trừ folder root
+        root_entry, entries = parse_listing(dav_response.text, username)
+        analytics.observe_listing(username, "/", root_entry, entries)
+        file_count = sum(1 for entry in entries if not entry["is_folder"])
 
-    return {
+    return json_response(request, {
         "username": user_data["id"],
         "display_name": user_data["display-name"],
         "email": user_data["email"],
         "quota": {
-            "used": quota["used"],
-            "available": quota["free"],
-            "total": quota["quota"],
-            "relative": quota.get("relative", 0)
+            "used": user_quota["used"],
+            "available": user_quota["free"],
+            "total": user_quota["quota"],
+            "relative": user_quota.get("relative", 0)
         },
-        "file_count": max(file_count, 0),
-        "last_login": user_data.get("lastlogin")
-    }
+        "file_count": file_count,
+        "last_login": user_data.get("lastlogin"),
+        "storage": analytics.summary(username)
+    })
 
 
 @app.post("/list-files")
-def list_files(username: str = Form(...), password: str = Form(...)):
-    auth = (username, password)
-
-    url = f"{settings.NEXTCLOUD_URL}/remote.php/dav/files/{username}/"
-
-    headers = {
-        "Depth": "1",
-        "Content-Type": "application/xml"
-    }
-
-    propfind_body = """
-        <d:propfind xmlns:d="DAV:">
-            <d:prop>
-                <d:getlastmodified />
-                <d:getcontentlength />
-                <d:getcontenttype />
-            </d:prop>
-        </d:propfind>
+def list_files(
+        request: Request,
+        username: str = Form(...),
+        password: str = Form(...),
+        folder: str = Form("/"),
+        sort: str = Form(None),
+        types: str = Form(None),
+        page_size: int = Form(None),
+        cursor: str = Form(None)
+):
     """
+    - folder: folder cần liệt kê (mặc định root)
+    - sort: "name", "size", "modified", "type", nhiều key cách nhau bởi dấu phẩy,
+      "-" phía trước = giảm dần (vd "-modified,name"). Mặc định: thứ tự của Nextcloud
+    - types: lọc theo content type, vd "folder,image/*,application/pdf"
+    - page_size + cursor: phân trang; lấy trang sau bằng next_cursor của trang trước
+      (giữ nguyên folder/sort/types)
+    """
+    folder = share.normalize_path(username, folder)
 
-    response = requests.request("PROPFIND", url, data=propfind_body, headers=headers, auth=auth)
-
-    if response.status_code != 207:
-        return JSONResponse(status_code=400, content={"error": response.text})
-
-    root = ET.fromstring(response.text)
-
-    files = []
+    try:
+        sort_keys = listings.parse_sort(sort)
+        type_filters = listings.parse_types(types)
+        if page_size is not None and not 1 <= page_size <= listings.MAX_PAGE_SIZE:
+            raise listings.ListingError(400, f"page_size must be between 1 and {listings.MAX_PAGE_SIZE}")
+
+        view, offset = listings.get_view(username, password, folder, sort_keys, type_filters, cursor)
+    except listings.ListingError as e:
+        return JSONResponse(status_code=e.status_code, content={"error": e.message})
+
+    vid = listings.view_id(folder, sort_keys, type_filters)
+    result = listings.page(view, offset, page_size, vid)
+
+    # ETag của folder đổi khi có file con thay đổi; cộng thêm tham số của trang
+    return json_response(
+        request,
+        result,
+        etag_source=(
+            f"list-files:{username}:{vid}:{view['etag']}:{offset}:{page_size}"
+            if view["etag"] else None
+        )
+    )
 
-    # Parse XML
-    for resp in root.findall("{DAV:}response"):
-        href = resp.find("{DAV:}href").text
 
-        # Bỏ thư mục root user/
-        if href.endswith(f"/dav/files/{username}/"):
-            continue
+# -----------------------
+# CHANGE FEED (SSE)
+# -----------------------
+@app.get("/changes")
+async def watch_changes(
+        folder: str = "/",
+        credentials: HTTPBasicCredentials = Depends(HTTPBasic(auto_error=False))
+):
+    """
+    Server-Sent Events thay cho việc poll /list-files.
+    Event đầu tiên là "snapshot" (toàn bộ folder), sau đó là "changes"
+    gồm added / removed / changed mỗi khi nội dung folder đổi.
 
-        props = resp.find("{DAV:}propstat/{DAV:}prop")
+    Thông tin đăng nhập gửi qua header Authorization: Basic (không đặt trong
+    query string để không lọt vào log / lịch sử trình duyệt). EventSource của
+    trình duyệt không gửi được header: dùng client SSE dựa trên fetch.
+    """
+    if credentials is None:
+        return JSONResponse(status_code=401, content={"error": "Missing Authorization header"})
+    username, password = credentials.username, credentials.password
 
-        size = props.find("{DAV:}getcontentlength")
-        modified = props.find("{DAV:}getlastmodified")
-        ctype = props.find("{DAV:}getcontenttype")
+    folder = share.normalize_path(username, folder)
 
-        files.append({
-            "path": href,
-            "name": href.split("/")[-1],
-            "size": int(size.text) if size is not None and size.text else 0,
-            "last_modified": modified.text if modified is not None else None,
-            "type": ctype.text if ctype is not None else "folder"
-        })
+    q, snapshot = await changefeed.subscribe(username, password, folder)
+    if q is None:
+        if snapshot == 401:
+            return JSONResponse(status_code=401, content={"error": "Invalid credentials"})
+        return JSONResponse(status_code=400, content={"error": f"Cannot watch {folder}"})
 
-    return {"files": files}
+    return StreamingResponse(
+        changefeed.stream(username, folder, q, snapshot),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
 
 
 @app.get("/view-file")
@@ -273,9 +638,9 @@ def view_file(
     filepath = filepath.lstrip("/")
 
     # Build real WebDAV URL
-    url = f"{settings.NEXTCLOUD_URL}/remote.php/dav/files/{username}/{filepath}"
+    url = dav_url(username, filepath)
 
-    r = requests.get(url, auth=auth)
+    r = user_session().get(url, auth=auth)
 
     if r.status_code != 200:
         return JSONResponse(status_code=400, content={"error": r.text})
@@ -303,25 +668,14 @@ def download_file(
     filepath = filepath.lstrip("/")
 
     # 4) Build URL gửi tới Nextcloud
-    nc_url = f"{settings.NEXTCLOUD_URL}/remote.php/dav/files/{username}/{filepath}"
-
-    # 5) Gửi request dạng stream để không load toàn bộ file vào RAM
-    r = requests.get(nc_url, auth=auth, stream=True)
+    nc_url = dav_url(username, filepath)
 
-    if r.status_code != 200:
-        return JSONResponse(status_code=400, content={"error": r.text})
-
-    # 6) Tách tên file
+    # 5) Tách tên file
     filename = filepath.split("/")[-1]
 
-    # 7) Trả về StreamingResponse để client tải file trực tiếp
-    return StreamingResponse(
-        r.iter_content(chunk_size=8192),  # stream từng phần
-        media_type="application/octet-stream",
-        headers={
-            "Content-Disposition": f"attachment; filename={filename}"
-        }
-    )
+    # 6) Stream từ Nextcloud (không load toàn bộ file vào RAM),
+    #    hoặc trả từ cache trên đĩa nếu ETag chưa đổi
+    return content_cache.download(username, f"/{filepath}", nc_url, auth, filename)
 
 
 # -----------------------
@@ -347,12 +701,18 @@ def delete_file_or_folder(
     filepath = filepath.lstrip("/")
 
     # 4) Build URL WebDAV
-    url = f"{settings.NEXTCLOUD_URL}/remote.php/dav/files/{username}/{filepath}"
+    url = dav_url(username, filepath)
 
     # 5) Gửi DELETE request
-    r = requests.delete(url, auth=auth)
+    r = user_session().delete(url, auth=auth)
 
     if r.status_code in [200, 204]:
+        freed = analytics.remove(username, "/" + filepath.strip("/"))
+        if freed is not None:
+            quota.release(username, freed)
+        else:
+            # Chưa biết kích thước (folder chưa từng liệt kê) -> lấy lại quota ở lần upload sau
+            quota.invalidate(username)
         return {
             "status": "success",
             "message": f"Deleted successfully: {filepath}"
@@ -367,17 +727,90 @@ def delete_file_or_folder(
     )
 
 
+# -----------------------
+# MOVE / RENAME / COPY
+# -----------------------
+@app.post("/move")
+def move_file_or_folder(
+        username: str = Form(...),
+        password: str = Form(...),
+        source: str = Form(...),
+        destination: str = Form(...),
+        overwrite: bool = Form(False)
+):
+    return _move_or_copy("MOVE", username, password, source, destination, overwrite)
+
+
+@app.post("/copy")
+def copy_file_or_folder(
+        username: str = Form(...),
+        password: str = Form(...),
+        source: str = Form(...),
+        destination: str = Form(...),
+        overwrite: bool = Form(False)
+):
+    return _move_or_copy("COPY", username, password, source, destination, overwrite)
+
+
+def _move_or_copy(method: str, username: str, password: str, source: str, destination: str, overwrite: bool):
+    """
+    WebDAV MOVE/COPY: Nextcloud tự xử lý phía server,
+    dữ liệu không đi qua backend dù file lớn cỡ nào.
+    """
+    auth = (username, password)
+
+    source = share.normalize_path(username, source)
+    destination = share.normalize_path(username, destination)
+
+    if source == "/" or destination == "/":
+        return JSONResponse(status_code=400, content={"error": "Cannot move or copy the root folder"})
+    if source.rstrip("/") == destination.rstrip("/"):
+        return JSONResponse(status_code=400, content={"error": "Source and destination are the same"})
+
+    headers = {
+        # Destination phải là URL đã encode (dav_url encode cả source lẫn destination)
+        "Destination": dav_url(username, destination),
+        "Overwrite": "T" if overwrite else "F"
+    }
+
+    r = user_session().request(method, dav_url(username, source), headers=headers, auth=auth)
+
+    if r.status_code in [201, 204]:
+        size = analytics.move(username, source.rstrip("/"), destination.rstrip("/"), keep_source=method == "COPY")
+        if method == "COPY":
+            # Bản copy chiếm thêm dung lượng
+            if size is not None and r.status_code == 201:
+                quota.consume(username, size)
+            else:
+                quota.invalidate(username)
+        return {
+            "status": "success",
+            "source": source,
+            "destination": destination,
+            "overwritten": r.status_code == 204
+        }
+
+    if r.status_code == 412:
+        return JSONResponse(status_code=409, content={"error": "Destination already exists"})
+    if r.status_code == 409:
+        return JSONResponse(status_code=409, content={"error": "Destination folder does not exist"})
+
+    return JSONResponse(status_code=400, content={"error": r.text})
+
+
 @app.post("/payment/vnpay/create")
 def create_vnpay_payment(
         request: Request,
         username: str = Form(...),
         plan: str = Form(...)
 ):
-    if plan not in PLANS:
+    if plan not in get_plans():
         return JSONResponse(status_code=400, content={"error": "Invalid plan"})
 
-    # Tạo order_id
-    order_id = "".join(random.choices(string.digits, k=10))
+    vnpay = get_provider("vnpay")
+
+    # Tạo order_id (dùng luôn làm vnp_TxnRef)
+    order_id = ids.vnpay_txn_ref()
 
     # Thời gian hiện tại
     now = datetime.datetime.now()
@@ -385,97 +818,117 @@ def create_vnpay_payment(
     expire_date = (now + datetime.timedelta(minutes=15)).strftime("%Y%m%d%H%M%S")
 
     # Số tiền (VNPay yêu cầu nhân 100)
-    amount = int(PLANS[plan]["amount"] * 100)
-
-    print(settings.VNPAY_TMNCODE, "/n", settings.VNPAY_RETURN_URL)
+    amount = int(get_plans()[plan]["amount"] * 100)
 
     vnp_params = {
         "vnp_Version": "2.1.0",
         "vnp_Command": "pay",
-        "vnp_TmnCode": settings.VNPAY_TMNCODE,
+        "vnp_TmnCode": vnpay.settings.VNPAY_TMNCODE,
         "vnp_Amount": amount,
         "vnp_CurrCode": "VND",
-        "vnp_TxnRef": f"{order_id}-{int(now.timestamp())}",  # order_id + timestamp
+        "vnp_TxnRef": order_id,
         "vnp_OrderInfo": f"Thanh toan goi {plan} cho nguoi dung {username}",
         "vnp_OrderType": "other",
         "vnp_Locale": "vn",
-        "vnp_ReturnUrl": settings.VNPAY_RETURN_URL,
+        "vnp_ReturnUrl": vnpay.settings.VNPAY_RETURN_URL,
         "vnp_IpAddr": request.client.host if request.client else "127.0.0.1",
         "vnp_CreateDate": create_date,
         "vnp_ExpireDate": expire_date,
     }
 
     # Tạo chữ ký bảo mật
-    secure_hash = create_vnpay_signature(vnp_params)
+    secure_hash = vnpay.create_vnpay_signature(vnp_params)
     vnp_params["vnp_SecureHash"] = secure_hash
 
     # Tạo URL thanh toán
     payment_url = (
-            settings.VNPAY_PAYMENT_URL
+            vnpay.settings.VNPAY_PAYMENT_URL
             + "?"
             + urllib.parse.urlencode(vnp_params)
     )
 
+    create_pending_payment(order_id, username, plan, int(get_plans()[plan]["amount"]), provider="vnpay")
+
     return {
         "payment_url": payment_url,
         "order_id": order_id
     }
 
 
+VNPAY_IPN_RESPONSES = {
+    "paid": ("00", "Confirm Success"),
+    "already_paid": ("02", "Order already confirmed"),
+    "not_found": ("01", "Order not found"),
+    "amount_mismatch": ("04", "Invalid amount"),
+}
+
+
+@app.get("/payment/vnpay/ipn")
+def vnpay_ipn(request: Request):
+    """
+    IPN của VNPay: tham số vnp_* trên query string, ký bằng vnp_SecureHash.
+    Trả lời theo định dạng VNPay chờ (RspCode / Message).
+    """
+    vnpay = get_provider("vnpay")
+    params = dict(request.query_params)
+
+    if not vnpay.verify_vnpay_signature(params):
+        return {"RspCode": "97", "Message": "Invalid signature"}
+
+    if params.get("vnp_ResponseCode") != "00" or params.get("vnp_TransactionStatus") != "00":
+        # Giao dịch không thành công: chỉ xác nhận đã nhận
+        return {"RspCode": "00", "Message": "Confirm Success"}
+
+    try:
+        # VNPay gửi số tiền nhân 100
+        amount = int(params["vnp_Amount"]) / 100
+    except (KeyError, ValueError):
+        return {"RspCode": "04", "Message": "Invalid amount"}
+
+    code, message = VNPAY_IPN_RESPONSES[_complete_payment(params.get("vnp_TxnRef"), amount)]
+    return {"RspCode": code, "Message": message}
+
+
 @app.post("/payment/momo/create")
 def create_momo_payment(
         username: str = Form(...),
         plan: str = Form(...)
 ):
-    if plan not in PLANS:
+    if plan not in get_plans():
         raise HTTPException(status_code=400, detail="Invalid plan")
 
-    order_id = f"MOMO{int(time.time())}"
+    momo = get_provider("momo")
+
+    order_id = ids.momo_order_id()
     request_id = order_id
-    amount = str(PLANS[plan]["amount"])
+    amount = str(get_plans()[plan]["amount"])
 
     order_info = f"Thanh toan goi {plan} cho nguoi dung {username}"
     extra_data = ""
 
-    raw_signature = (
-        f"accessKey={settings.MOMO_ACCESS_KEY}"
-        f"&amount={amount}"
-        f"&extraData={extra_data}"
-        f"&ipnUrl={settings.MOMO_RETURN_URL}"
-        f"&orderId={order_id}"
-        f"&orderInfo={order_info}"
-        f"&partnerCode={settings.PARTNER_CODE}"
-        f"&redirectUrl={settings.MOMO_RETURN_URL}"
-        f"&requestId={request_id}"
-        f"&requestType=captureWallet"
-    )
-
-    signature = create_momo_signature(
-        raw_signature,
-        settings.MOMO_SECRET_KEY
-    )
-
     payload = {
-        "partnerCode": settings.PARTNER_CODE,
-        "accessKey": settings.MOMO_ACCESS_KEY,
+        "partnerCode": momo.settings.PARTNER_CODE,
+        "accessKey": momo.settings.MOMO_ACCESS_KEY,
         "requestId": request_id,
         "amount": amount,
         "orderId": order_id,
         "orderInfo": order_info,
-        "redirectUrl": settings.MOMO_RETURN_URL,
-        "ipnUrl": settings.MOMO_RETURN_URL,
+        "redirectUrl": momo.settings.MOMO_RETURN_URL,
+        "ipnUrl": momo.settings.MOMO_RETURN_URL,
         "extraData": extra_data,
         "requestType": "captureWallet",
-        "signature": signature,
         "lang": "vi"
     }
+    payload["signature"] = momo.create_momo_signature(payload)
 
-    response = requests.post(settings.ENDPOINT, json=payload, timeout=10)
+    response = gateway_session().post(momo.settings.ENDPOINT, json=payload, timeout=10)
     result = response.json()
 
     if result.get("resultCode") != 0:
         return JSONResponse(status_code=400, content=result)
 
+    create_pending_payment(order_id, username, plan, int(amount), provider="momo")
+
     return {
         "payUrl": result["payUrl"],
         "orderId": order_id
@@ -484,63 +937,55 @@ def create_momo_payment(
 
 @app.post("/payment/notify")
 async def momo_notify(request: Request):
-    data = await request.json()
-
-    raw_signature = (
-        f"accessKey={data['accessKey']}"
-        f"&amount={data['amount']}"
-        f"&extraData={data['extraData']}"
-        f"&message={data['message']}"
-        f"&orderId={data['orderId']}"
-        f"&orderInfo={data['orderInfo']}"
-        f"&orderType={data['orderType']}"
-        f"&partnerCode={data['partnerCode']}"
-        f"&payType={data['payType']}"
-        f"&requestId={data['requestId']}"
-        f"&responseTime={data['responseTime']}"
-        f"&resultCode={data['resultCode']}"
-        f"&transId={data['transId']}"
-    )
-
-    signature = create_momo_signature()
+    momo = get_provider("momo")
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return JSONResponse(status_code=400, content={"status": "invalid body"})
 
-    if signature != data["signature"]:
+    if not momo.verify_momo_ipn(data):
         return {"status": "invalid signature"}
 
-    if data["resultCode"] == 0:
-        # TODO: nâng dung lượng Nextcloud
-        pass
+    if data.get("resultCode") == 0:
+        try:
+            amount = int(data["amount"])
+        except (KeyError, TypeError, ValueError):
+            return JSONResponse(status_code=400, content={"status": "invalid amount"})
+        result = await run_in_threadpool(_complete_payment, data.get("orderId"), amount)
+        if result not in ("paid", "already_paid"):
+            return JSONResponse(status_code=400, content={"status": result})
 
     return {"status": "ok"}
 
 
 # Hàm phụ trợ: Nâng cấp dung lượng trên Nextcloud
 def update_nextcloud_quota(username: str, plan_name: str):
-    if plan_name not in PLANS:
+    plans = get_plans()
+    if plan_name not in plans:
         return False
 
     # Lấy quota từ file plans.json (ví dụ: "10GB")
-    new_quota = PLANS[plan_name]["quota"]
+    new_quota = plans[plan_name]["quota"]
 
     url = f"{settings.NEXTCLOUD_URL}/ocs/v1.php/cloud/users/{username}"
-    headers = {
-        "OCS-APIRequest": "true"
-    }
     # API Nextcloud yêu cầu method PUT để sửa user
     payload = {
         "key": "quota",
         "value": new_quota
     }
-    auth = (settings.NC_USERNAME, settings.NC_PASSWORD)
 
     try:
-        r = requests.put(url, auth=auth, headers=headers, data=payload)
+        r = admin_session().put(url, data=payload)
         if r.status_code == 200:
+            quota.invalidate(username)
+            accounts.invalidate(username)
             return True
-        print(f"Lỗi Nextcloud: {r.text}")  # Debug
+        logger.warning("quota update failed", extra={"username": username, "plan": plan_name, "detail": r.text})
         return False
-    except Exception as e:
-        print(f"Lỗi kết nối: {e}")
+    except Exception:
+        logger.exception("quota update failed", extra={"username": username, "plan": plan_name})
         return False
 
 
@@ -580,7 +1025,7 @@ def save_payments(data):
         json.dump(data, f, ensure_ascii=False, indent=2)
 
 
-def create_pending_payment(app_trans_id, username, plan, amount):
+def create_pending_payment(app_trans_id, username, plan, amount, provider="zalopay"):
     with payment_lock:
         data = load_payments()
         data[app_trans_id] = {
@@ -588,37 +1033,59 @@ def create_pending_payment(app_trans_id, username, plan, amount):
             "username": username,
             "plan": plan,
             "amount": amount,
-            "provider": "zalopay",
+            "provider": provider,
             "created_at": datetime.datetime.now().isoformat()
         }
         save_payments(data)
 
 
-def mark_paid(app_trans_id):
+def mark_paid(app_trans_id, amount):
+    """
+    PENDING -> PAID nếu số tiền cổng báo khớp với đơn đã tạo.
+    Trả về (kết quả, thông tin đơn); kết quả là một trong
+    "paid", "already_paid", "not_found", "amount_mismatch".
+    """
     with payment_lock:
         data = load_payments()
-        if app_trans_id not in data:
-            return False
-        data[app_trans_id]["status"] = "PAID"
-        data[app_trans_id]["paid_at"] = datetime.datetime.now().isoformat()
+        payment_info = data.get(app_trans_id)
+        if payment_info is None:
+            return "not_found", None
+        if payment_info["amount"] != amount:
+            return "amount_mismatch", payment_info
+        if payment_info["status"] == "PAID":
+            return "already_paid", payment_info
+        payment_info["status"] = "PAID"
+        payment_info["paid_at"] = datetime.datetime.now().isoformat()
         save_payments(data)
-        return True
+        return "paid", payment_info
+
+
+def _complete_payment(app_trans_id, amount):
+    # Chỉ gọi sau khi đã kiểm tra chữ ký của cổng thanh toán
+    result, payment_info = mark_paid(app_trans_id, amount)
+    if result == "paid":
+        update_nextcloud_quota(username=payment_info["username"], plan_name=payment_info["plan"])
+    else:
+        logger.warning("payment not completed", extra={"order": app_trans_id, "result": result})
+    return result
 
 
 @app.post("/payment/zalopay/create")
 def create_zalopay_payment(username: str = Form(...), plan: str = Form(...)):
-    if plan not in PLANS:
+    if plan not in get_plans():
         raise HTTPException(status_code=400, detail="Invalid plan")
 
-    app_trans_id = time.strftime("%y%m%d") + "_" + str(int(time.time()))
-    amount = int(PLANS[plan]["amount"])
+    zalopay = get_provider("zalopay")
+
+    app_trans_id = ids.zalopay_trans_id()
+    amount = int(get_plans()[plan]["amount"])
 
     embed_data = {
-        "redirecturl": settings.ZALOPAY_RETURN_URL
+        "redirecturl": zalopay.settings.ZALOPAY_RETURN_URL
     }
 
     order = {
-        "app_id": int(settings.ZALOPAY_APP_ID),
+        "app_id": int(zalopay.settings.ZALOPAY_APP_ID),
         "app_trans_id": app_trans_id,
         "app_user": username,
         "amount": amount,
@@ -626,19 +1093,13 @@ def create_zalopay_payment(username: str = Form(...), plan: str = Form(...)):
         "embed_data": json.dumps(embed_data),
         "item": json.dumps([{"plan": plan}]),
         "description": f"Nang cap goi {plan}",
-        "callback_url": settings.ZALOPAY_CALLBACK_URL
+        "callback_url": zalopay.settings.ZALOPAY_CALLBACK_URL
     }
 
-    data = (
-        f"{order['app_id']}|{order['app_trans_id']}|{order['app_user']}|"
-        f"{order['amount']}|{order['app_time']}|"
-        f"{order['embed_data']}|{order['item']}"
-    )
-
-    order["mac"] = generate_mac(data, settings.ZALOPAY_KEY1)
+    order["mac"] = zalopay.create_order_mac(order, zalopay.settings.ZALOPAY_KEY1)
 
-    res = requests.post(
-        settings.ZALOPAY_CREATE_ORDER_URL,
+    res = gateway_session().post(
+        zalopay.settings.ZALOPAY_CREATE_ORDER_URL,
         data=order,
         timeout=10
     ).json()
@@ -655,22 +1116,30 @@ def create_zalopay_payment(username: str = Form(...), plan: str = Form(...)):
 
 
 @app.post("/payment/zalopay/callback")
-def zalopay_callback(
-        app_trans_id: str = Form(...),
-        status: int = Form(...),
-):
-    if status != 1:
-        return JSONResponse(status_code=400, content={"error": "Payment failed"})
+async def zalopay_callback(request: Request):
+    """
+    ZaloPay gửi JSON {"data": "<chuỗi JSON của đơn>", "mac": "...", "type": 1}
+    khi thanh toán thành công; mac = HMAC-SHA256(data, KEY2).
+    Trả lời theo định dạng ZaloPay chờ: return_code 1 = đã xử lý,
+    -1 = mac sai, 0 = lỗi (ZaloPay sẽ gọi lại).
+    """
+    zalopay = get_provider("zalopay")
 
-    success = mark_paid(app_trans_id)
-    if not success:
-        return JSONResponse(status_code=400, content={"error": "Transaction not found"})
-    # Load payment info to get username and plan
-    payments = load_payments()
-    payment_info = payments.get(app_trans_id)
-    if not payment_info:
-        return JSONResponse(status_code=400, content={"error": "Payment info not found"})
+    try:
+        body = await request.json()
+        data, mac = body["data"], body["mac"]
+    except (ValueError, KeyError, TypeError):
+        return {"return_code": -1, "return_message": "invalid callback"}
 
-    update_nextcloud_quota(username=payment_info["username"], plan_name=payment_info["plan"])
+    if not isinstance(data, str) or not zalopay.verify_callback_mac(data, mac, zalopay.settings.ZALOPAY_KEY2):
+        return {"return_code": -1, "return_message": "mac not equal"}
 
-    return {"status": "ok"}
+    order = json.loads(data)
+    result = await run_in_threadpool(_complete_payment, order["app_trans_id"], int(order["amount"]))
+    if result in ("paid", "already_paid"):
+        return {"return_code": 1, "return_message": "success"}
+    return {"return_code": 0, "return_message": result}
+
+
+# Đo một lần khi import xong: với preload_app, worker fork từ master nên không đo lại ở lifespan
+IMPORT_MS = (time.perf_counter() - _IMPORT_STARTED) * 1000
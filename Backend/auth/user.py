@@ -1,8 +1,16 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 from fastapi import APIRouter, Form
 from starlette.responses import JSONResponse
 
+import accounts
+import changefeed
+import quota
 from config import settings
+from sharing import share
+from upstream import user_session
 
 router = APIRouter()
 
@@ -14,32 +22,28 @@ def get_my_profile(
         username: str = Form(...),
         password: str = Form(...)
 ):
-    auth = (username, password)
+    data = accounts.get_user_info(username, password)
 
-    url = f"{settings.NEXTCLOUD_URL}/ocs/v1.php/cloud/user"
-    headers = {
-        "OCS-APIRequest": "true",
-        "Accept": "application/json"
-    }
-
-    r = requests.get(url, auth=auth, headers=headers)
-
-    if r.status_code != 200 or "ocs" not in r.text:
+    if data is None:
         return JSONResponse(
             status_code=401,
             content={"error": "Invalid credentials"}
         )
 
-    data = r.json()["ocs"]["data"]
+    # Record quota (được cộng/trừ sau mỗi upload/xóa) mới hơn user info trong cache
+    record = quota.get_cached(username)
+    if record is None:
+        quota.remember(username, data["quota"])
+        record = quota.get_cached(username)
 
     return {
         "id": data["id"],
         "display_name": data["display-name"],
         "email": data["email"],
         "quota": {
-            "used": data["quota"]["used"],
-            "free": data["quota"]["free"],
-            "total": data["quota"]["quota"],
+            "used": record["used"],
+            "free": record["free"],
+            "total": record["total"],
             "relative": data["quota"].get("relative", 0)
         },
         "last_login": data.get("lastlogin")
@@ -49,6 +53,41 @@ def get_my_profile(
 # -----------------------
 # UPDATE USER PROFILE
 # -----------------------
+# Field của form -> (key khi PUT lên OCS, key trong record /cloud/user)
+PROFILE_FIELDS = {
+    "displayname": ("displayname", "display-name"),
+    "email": ("email", "email"),
+}
+
+
+def put_user_field(username: str, auth, key: str, value: str) -> dict:
+    """
+    PUT một field của user qua OCS. {"status": "updated"} hoặc {"status": "error", "detail": ...}
+    """
+    url = f"{settings.NEXTCLOUD_URL}/ocs/v1.php/cloud/users/{username}"
+    headers = {
+        "OCS-APIRequest": "true",
+        "Accept": "application/json"
+    }
+
+    try:
+        r = user_session().put(url, auth=auth, headers=headers, data={"key": key, "value": value})
+    except requests.RequestException as e:
+        return {"status": "error", "detail": str(e)}
+
+    if r.status_code != 200:
+        return {"status": "error", "detail": r.text}
+
+    # OCS v1 trả HTTP 200 kể cả khi lỗi: mã thật nằm trong ocs.meta.statuscode (100 = OK)
+    try:
+        meta = r.json()["ocs"]["meta"]
+    except (ValueError, KeyError, TypeError):
+        return {"status": "updated"}
+    if meta.get("statuscode") != 100:
+        return {"status": "error", "detail": meta.get("message") or r.text}
+    return {"status": "updated"}
+
+
 @router.post("/me/update")
 def update_my_profile(
         username: str = Form(...),
@@ -57,43 +96,58 @@ def update_my_profile(
         email: str = Form(None),
         new_password: str = Form(None)
 ):
+    """
+    Tên hiển thị và email được cập nhật song song; mật khẩu đổi sau cùng
+    để các lệnh trước vẫn xác thực được bằng mật khẩu cũ.
+    Trả về kết quả của từng field.
+    """
     auth = (username, password)
 
-    url = f"{settings.NEXTCLOUD_URL}/ocs/v1.php/cloud/users/{username}"
-    headers = {
-        "OCS-APIRequest": "true",
-        "Accept": "application/json"
-    }
-
-    # Map field -> Nextcloud key
-    updates = {
-        "displayname": displayname,
-        "email": email,
-        "password": new_password
-    }
+    values = {"displayname": displayname, "email": email}
+    fields = [field for field, value in values.items() if value]
 
-    for key, value in updates.items():
-        if value:
-            r = requests.put(
-                url,
-                auth=auth,
-                headers=headers,
-                data={
-                    "key": key,
-                    "value": value
-                }
-            )
-
-            if r.status_code != 200:
-                return JSONResponse(
-                    status_code=400,
-                    content={
-                        "error": f"Failed to update {key}",
-                        "detail": r.text
-                    }
+    results = {}
+    if fields:
+        with ThreadPoolExecutor(max_workers=len(fields)) as pool:
+            futures = {
+                field: pool.submit(
+                    contextvars.copy_context().run,
+                    put_user_field, username, auth, PROFILE_FIELDS[field][0], values[field]
                 )
+                for field in fields
+            }
+            results = {field: future.result() for field, future in futures.items()}
+
+    if new_password:
+        results["password"] = put_user_field(username, auth, "password", new_password)
+        # Kể cả khi lỗi mạng (không chắc đã đổi hay chưa): không giữ gì gắn với mật khẩu cũ
+        share.invalidate_shares(username)
+        changefeed.forget_user(username)
+
+    failed = [field for field, result in results.items() if result["status"] != "updated"]
+
+    if not failed:
+        # Sửa record trong cache tại chỗ, /auth/me không phải gọi lại Nextcloud
+        accounts.update_cached(
+            username, password,
+            {PROFILE_FIELDS[field][1]: values[field] for field in fields},
+            new_password
+        )
+    else:
+        # Lỗi mạng giữa chừng thì không chắc field đã đổi hay chưa: lấy lại lần sau
+        accounts.invalidate(username)
+
+    if failed:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "error": f"Failed to update {', '.join(failed)}",
+                "results": results
+            }
+        )
 
     return {
         "status": "success",
-        "message": "Cập nhật thông tin thành công"
-    }
\ No newline at end of file
+        "message": "Cập nhật thông tin thành công",
+        "results": results
+    }
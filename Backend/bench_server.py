@@ -0,0 +1,131 @@
+"""
+So sánh throughput giữa cách chạy cũ (1 process uvicorn, asyncio + h11)
+và chế độ production (gunicorn.conf.py: nhiều worker, uvloop + httptools).
+
+    python bench_server.py [--workers N] [--clients C] [--duration S] [--path /payment]
+
+Mặc định gọi POST /payment (không chạm tới Nextcloud) để đo phần việc của
+chính server. Muốn đo cả đường đi tới Nextcloud thì dùng --path /ready.
+Cần file .env như khi chạy app. Client chạy ở các process riêng, mỗi client
+giữ một kết nối keep-alive.
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import time
+
+BODY = "username=bench&amount=1"
+HEADERS = {"Content-Type": "application/x-www-form-urlencoded"}
+
+
+def client(port: int, path: str, duration: float, results):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    method = "GET" if path == "/ready" else "POST"
+    body = None if method == "GET" else BODY
+    done = errors = 0
+    deadline = time.perf_counter() + duration
+
+    while time.perf_counter() < deadline:
+        try:
+            conn.request(method, path, body=body, headers=HEADERS)
+            r = conn.getresponse()
+            r.read()
+            if r.status < 500:
+                done += 1
+            else:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port)
+
+    results.put((done, errors))
+
+
+def wait_until_up(port: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/docs")
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def run(name: str, cmd: list, env: dict, port: int, processes: int, args) -> float:
+    server = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(port)
+        results = multiprocessing.Queue()
+        clients = [
+            multiprocessing.Process(target=client, args=(port, args.path, args.duration, results))
+            for _ in range(args.clients)
+        ]
+        for p in clients:
+            p.start()
+        done = errors = 0
+        for _ in clients:
+            d, e = results.get()
+            done += d
+            errors += e
+        for p in clients:
+            p.join()
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+    rps = done / args.duration
+    print(f"{name:<34} {processes:>7} {rps:>12,.0f} {rps / processes:>14,.0f} {errors:>8}")
+    return rps
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--clients", type=int, default=2 * os.cpu_count())
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--path", default="/payment")
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(here)
+    # Không chờ load balancer khi tắt server giữa các lượt đo
+    env = {**os.environ, "SHUTDOWN_DRAIN_DELAY": "0"}
+
+    print(f"{args.clients} clients, {args.duration:.0f}s, {args.path}")
+    print(f"{'mode':<34} {'workers':>7} {'req/s':>12} {'req/s/worker':>14} {'errors':>8}")
+
+    baseline = run(
+        "uvicorn (asyncio + h11)",
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", "8101", "--loop", "asyncio",
+         "--http", "h11", "--no-access-log"],
+        env, 8101, 1, args
+    )
+
+    tuned = run(
+        "uvicorn (uvloop + httptools)",
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", "8102", "--loop", "uvloop",
+         "--http", "httptools", "--no-access-log"],
+        env, 8102, 1, args
+    )
+
+    gunicorn_env = {**env, "PORT": "8103", "WEB_CONCURRENCY": str(args.workers), "ID_HOST_ID": "0"}
+    production = run(
+        "gunicorn.conf.py",
+        [sys.executable, "-m", "gunicorn", "app:app", "-c", "gunicorn.conf.py"],
+        gunicorn_env, 8103, args.workers, args
+    )
+
+    print(f"\nuvloop + httptools: {tuned / baseline:.2f}x per core, "
+          f"gunicorn x{args.workers}: {production / baseline:.2f}x total")
+
+
+if __name__ == "__main__":
+    main()
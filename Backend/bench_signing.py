@@ -0,0 +1,76 @@
+"""
+Micro-benchmark ký / xác thực chữ ký thanh toán.
+
+    python bench_signing.py [số lần lặp]
+
+So sánh cách cũ (hmac.new với key cho mỗi lần ký) với Signer đã nạp sẵn key,
+cho chuỗi ký thật của từng cổng. Không cần file .env.
+"""
+import hmac
+import sys
+import time
+
+from signing import (
+    get_signer, momo_canonical, zalopay_canonical, vnpay_canonical,
+    MOMO_CREATE_FIELDS, MOMO_IPN_FIELDS, ZALOPAY_CREATE_FIELDS,
+)
+
+SECRET = "K951B6PE1waDMi640xX08PD3vg6EkVlz"
+
+SAMPLES = {
+    "vnpay": ("sha512", vnpay_canonical({
+        "vnp_Version": "2.1.0", "vnp_Command": "pay", "vnp_TmnCode": "DEMOV210",
+        "vnp_Amount": 5000000, "vnp_CurrCode": "VND", "vnp_TxnRef": "237902819397468160",
+        "vnp_OrderInfo": "Thanh toan goi basic cho nguoi dung test", "vnp_OrderType": "other",
+        "vnp_Locale": "vn", "vnp_ReturnUrl": "https://example.com/payment/return",
+        "vnp_IpAddr": "127.0.0.1", "vnp_CreateDate": "20251019120000", "vnp_ExpireDate": "20251019121500",
+    })),
+    "momo create": ("sha256", momo_canonical({
+        "accessKey": "F8BBA842ECF85", "amount": "50000", "extraData": "",
+        "ipnUrl": "https://example.com/payment/notify", "orderId": "MOMO237902819397468160",
+        "orderInfo": "Thanh toan goi basic cho nguoi dung test", "partnerCode": "MOMO",
+        "redirectUrl": "https://example.com/payment/return", "requestId": "MOMO237902819397468160",
+        "requestType": "captureWallet",
+    }, MOMO_CREATE_FIELDS)),
+    "momo ipn": ("sha256", momo_canonical({
+        "accessKey": "F8BBA842ECF85", "amount": 50000, "extraData": "", "message": "Successful.",
+        "orderId": "MOMO237902819397468160", "orderInfo": "Thanh toan goi basic cho nguoi dung test",
+        "orderType": "momo_wallet", "partnerCode": "MOMO", "payType": "qr",
+        "requestId": "MOMO237902819397468160", "responseTime": 1760850000000, "resultCode": 0,
+        "transId": 4088878653,
+    }, MOMO_IPN_FIELDS)),
+    "zalopay": ("sha256", zalopay_canonical({
+        "app_id": 2553, "app_trans_id": "251019_237902819397468160", "app_user": "test",
+        "amount": 50000, "app_time": 1760850000000,
+        "embed_data": '{"redirecturl": "https://example.com/payment/return"}',
+        "item": '[{"plan": "basic"}]',
+    }, ZALOPAY_CREATE_FIELDS)),
+}
+
+
+def rate(fn, n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return n / (time.perf_counter() - start)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    print(f"{'gateway':<12} {'sign (old)':>14} {'sign':>14} {'verify':>14}   ops/s, {n} iterations")
+
+    for name, (digest, message) in SAMPLES.items():
+        signer = get_signer(SECRET, digest)
+        signature = signer.sign(message)
+
+        def sign_old():
+            return hmac.new(SECRET.encode(), message.encode(), digest).hexdigest()
+
+        old = rate(sign_old, n)
+        new = rate(lambda: signer.sign(message), n)
+        verify = rate(lambda: signer.verify(message, signature), n)
+        print(f"{name:<12} {old:>14,.0f} {new:>14,.0f} {verify:>14,.0f}   ({new / old:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from config import settings
+
+try:
+    import redis
+except ImportError:  # optional dependency
+    redis = None
+
+# Cache 2 tầng dùng chung giữa các worker:
+#   L1: LRU trong process (nhanh nhất, mỗi worker một bản)
+#   L2: SQLite trên đĩa local (mặc định) hoặc Redis (CACHE_URL=redis://...)
+# Ghi / xóa một key ở worker nào thì các worker khác bỏ bản L1 của key đó
+# trong vòng INVALIDATION_POLL giây (qua log invalidation ở L2).
+L1_MAX_ENTRIES = 10000
+# L1 giữ JSON thô của value: giới hạn cả tổng dung lượng, và không giữ value
+# quá lớn (listing cả folder, analytics của user) - chúng đọc thẳng từ L2
+L1_MAX_BYTES = 64 * 1024 * 1024
+L1_MAX_VALUE_BYTES = 1024 * 1024
+INVALIDATION_POLL = 0.5
+
+DEFAULT_SQLITE_PATH = os.path.join(tempfile.gettempdir(), "backend-cache.sqlite3")
+
+
+class SQLiteBackend:
+    """
+    L2 trên một file SQLite (WAL) mà mọi worker trên máy cùng mở.
+    Dùng thay Redis khi chạy một máy.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        # Sau fork (gunicorn preload) không dùng lại connection của process cha
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS invalidations "
+                "(seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT, at REAL)"
+            )
+            try:
+                os.chmod(self.path, 0o600)
+            except OSError:
+                pass
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str):
+        row = self._conn().execute(
+            "SELECT value, expires FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[1] < time.time():
+            return None, 0
+        return row[0], row[1]
+
+    def set(self, key: str, value: str, ttl: float):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (key, value, expires) VALUES (?, ?, ?)",
+            (key, value, time.time() + ttl)
+        )
+        if random.random() < 0.01:
+            conn.execute("DELETE FROM entries WHERE expires < ?", (time.time(),))
+
+    def delete(self, key: str):
+        self._conn().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def publish(self, key: str):
+        conn = self._conn()
+        conn.execute("INSERT INTO invalidations (key, at) VALUES (?, ?)", (key, time.time()))
+        if random.random() < 0.01:
+            conn.execute("DELETE FROM invalidations WHERE at < ?", (time.time() - 3600,))
+
+    def invalidations_since(self, cursor):
+        conn = self._conn()
+        if cursor is None:
+            row = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM invalidations").fetchone()
+            return row[0], []
+        rows = conn.execute(
+            "SELECT seq, key FROM invalidations WHERE seq > ? ORDER BY seq", (cursor,)
+        ).fetchall()
+        if not rows:
+            return cursor, []
+        return rows[-1][0], [key for _, key in rows]
+
+
+class RedisBackend:
+    STREAM = "cache:invalidations"
+
+    def __init__(self, url: str):
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str):
+        with self._client.pipeline() as pipe:
+            value, ttl_ms = pipe.get(key).pttl(key).execute()
+        if value is None:
+            return None, 0
+        return value.decode("utf-8"), time.time() + max(ttl_ms, 0) / 1000
+
+    def set(self, key: str, value: str, ttl: float):
+        self._client.set(key, value, px=int(ttl * 1000))
+
+    def delete(self, key: str):
+        self._client.delete(key)
+
+    def publish(self, key: str):
+        self._client.xadd(self.STREAM, {"key": key}, maxlen=10000, approximate=True)
+
+    def invalidations_since(self, cursor):
+        if cursor is None:
+            last = self._client.xrevrange(self.STREAM, count=1)
+            return (last[0][0] if last else b"0-0"), []
+        entries = self._client.xrange(self.STREAM, min=b"(" + cursor, count=1000)
+        if not entries:
+            return cursor, []
+        return entries[-1][0], [fields[b"key"].decode("utf-8") for _, fields in entries]
+
+
+class MemoryBackend:
+    """
+    Không có L2 (CACHE_URL=memory://): chỉ đúng khi chạy 1 worker.
+    """
+
+    def get(self, key: str):
+        return None, 0
+
+    def set(self, key: str, value: str, ttl: float):
+        pass
+
+    def delete(self, key: str):
+        pass
+
+    def publish(self, key: str):
+        pass
+
+    def invalidations_since(self, cursor):
+        return cursor, []
+
+
+def _make_backend():
+    url = settings.CACHE_URL or f"sqlite:///{DEFAULT_SQLITE_PATH}"
+    if url.startswith("memory://"):
+        return MemoryBackend()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        if redis is None:
+            raise RuntimeError("CACHE_URL points to Redis but the redis package is not installed")
+        return RedisBackend(url)
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    raise RuntimeError(f"Unsupported CACHE_URL: {url}")
+
+
+class _Cache:
+    def __init__(self):
+        self._l1 = OrderedDict()  # key -> (value, expires)
+        self._l1_bytes = 0
+        self._lock = threading.Lock()
+        self._backend = None
+        self._cursor = None
+        self._last_poll = 0.0
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = _make_backend()
+                    self._cursor, _ = self._backend.invalidations_since(None)
+                    self._last_poll = time.monotonic()
+        return self._backend
+
+    def _poll_invalidations(self):
+        now = time.monotonic()
+        if now - self._last_poll < INVALIDATION_POLL:
+            return
+        self._last_poll = now
+        cursor, keys = self.backend.invalidations_since(self._cursor)
+        with self._lock:
+            self._cursor = cursor
+            for key in keys:
+                self._forget(key)
+
+    def get(self, key: str):
+        backend = self.backend
+        self._poll_invalidations()
+
+        with self._lock:
+            item = self._l1.get(key)
+            if item is not None:
+                if item[1] > time.time():
+                    self._l1.move_to_end(key)
+                    return json.loads(item[0])
+                self._forget(key)
+
+        raw, expires = backend.get(key)
+        if raw is None:
+            return None
+        self._remember(key, raw, expires)
+        return json.loads(raw)
+
+    def set(self, key: str, value, ttl: float):
+        raw = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        self.backend.set(key, raw, ttl)
+        self.backend.publish(key)
+        self._remember(key, raw, time.time() + ttl)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._forget(key)
+        self.backend.delete(key)
+        self.backend.publish(key)
+
+    def _forget(self, key: str):
+        # Gọi khi đang giữ self._lock
+        item = self._l1.pop(key, None)
+        if item is not None:
+            self._l1_bytes -= len(item[0])
+
+    def _remember(self, key: str, raw: str, expires: float):
+        with self._lock:
+            self._forget(key)
+            # memory://: L1 là nơi lưu duy nhất, chỉ giới hạn theo tổng dung lượng
+            limit = L1_MAX_BYTES if isinstance(self._backend, MemoryBackend) else L1_MAX_VALUE_BYTES
+            if len(raw) > limit:
+                return
+            self._l1[key] = (raw, expires)
+            self._l1_bytes += len(raw)
+            while len(self._l1) > L1_MAX_ENTRIES or self._l1_bytes > L1_MAX_BYTES:
+                _, (old, _) = self._l1.popitem(last=False)
+                self._l1_bytes -= len(old)
+
+
+_cache = _Cache()
+
+
+def get(key: str):
+    return _cache.get(key)
+
+
+def set(key: str, value, ttl: float):
+    _cache.set(key, value, ttl)
+
+
+def delete(key: str):
+    _cache.delete(key)
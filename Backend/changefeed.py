@@ -0,0 +1,227 @@
+import asyncio
+import contextvars
+import json
+
+from starlette.concurrency import run_in_threadpool
+
+import analytics
+from webdav import propfind, parse_listing, probe_etag
+
+# Mọi folder đang được theo dõi được kiểm tra cùng một nhịp, bất kể số client
+POLL_INTERVAL = 5
+
+# Gửi comment giữ kết nối (proxy hay đóng kết nối im lặng quá lâu)
+HEARTBEAT_INTERVAL = 15
+
+# Client đọc chậm quá số event này thì bị yêu cầu tải lại toàn bộ (resync)
+SUBSCRIBER_QUEUE_SIZE = 100
+
+_watches = {}
+_ticker = None
+_closing = False
+_loop = None
+
+
+class _Watch:
+    """
+    Một folder của một user đang có client theo dõi.
+    entries: path -> entry (xem webdav.parse_listing) của lần liệt kê gần nhất.
+    """
+
+    def __init__(self, username: str, folder: str, auth):
+        self.username = username
+        self.folder = folder
+        self.auth = auth
+        self.etag = None
+        self.entries = {}
+        self.subscribers = set()
+
+    def publish(self, event: dict):
+        for q in list(self.subscribers):
+            try:
+                q.put_nowait(event)
+            except asyncio.QueueFull:
+                # Client không theo kịp: bỏ các diff đang chờ, báo tải lại
+                while not q.empty():
+                    q.get_nowait()
+                q.put_nowait({"event": "resync", "etag": self.etag})
+
+
+def _summary(entry: dict) -> dict:
+    return {
+        "path": entry["path"],
+        "size": entry["size"],
+        "last_modified": entry["last_modified"],
+        "type": entry["type"] or "folder",
+        "etag": entry["etag"],
+    }
+
+
+def _list(username: str, folder: str, auth):
+    r = propfind(username, auth, folder)
+    if r.status_code != 207:
+        return r.status_code, None, None
+    folder_entry, entries = parse_listing(r.text, username, folder)
+    analytics.observe_listing(username, folder, folder_entry, entries)
+    etag = folder_entry["etag"] if folder_entry else None
+    return r.status_code, etag, {entry["path"]: _summary(entry) for entry in entries}
+
+
+async def _refresh(watch: _Watch):
+    status, etag = await run_in_threadpool(probe_etag, watch.username, watch.auth, watch.folder)
+
+    if status != 207:
+        watch.publish({"event": "error", "status": status})
+        return
+    if etag == watch.etag:
+        return
+
+    status, etag, entries = await run_in_threadpool(_list, watch.username, watch.folder, watch.auth)
+    if entries is None:
+        watch.publish({"event": "error", "status": status})
+        return
+
+    old = watch.entries
+    added = [entry for path, entry in entries.items() if path not in old]
+    removed = [path for path in old if path not in entries]
+    changed = [
+        entry for path, entry in entries.items()
+        if path in old and old[path] != entry
+    ]
+
+    watch.etag = etag
+    watch.entries = entries
+    if added or removed or changed:
+        watch.publish({"event": "changes", "etag": etag, "added": added, "removed": removed, "changed": changed})
+
+
+async def _tick():
+    global _ticker
+    try:
+        while _watches:
+            await asyncio.sleep(POLL_INTERVAL)
+            watches = list(_watches.values())
+            results = await asyncio.gather(*(_refresh(w) for w in watches), return_exceptions=True)
+            for watch, result in zip(watches, results):
+                if isinstance(result, Exception):
+                    watch.publish({"event": "error", "error": str(result)})
+    finally:
+        _ticker = None
+
+
+async def subscribe(username: str, password: str, folder: str):
+    """
+    Đăng ký nhận thay đổi của folder.
+    Trả về (queue, snapshot) hoặc (None, status_code) nếu không truy cập được.
+    """
+    global _ticker, _loop
+    if _closing:
+        return None, 503
+    _loop = asyncio.get_running_loop()
+    auth = (username, password)
+    key = (username, folder)
+    watch = _watches.get(key)
+
+    if watch is not None and watch.etag is not None:
+        # Đã có snapshot: chỉ cần xác thực client mới bằng probe Depth 0
+        status, _ = await run_in_threadpool(probe_etag, username, auth, folder)
+        if status != 207:
+            return None, status
+        # Trong lúc chờ, subscriber cuối có thể đã rời đi và watch bị xóa:
+        # khi đó ticker không còn refresh nó nữa, phải tạo lại
+        watch = _watches.get(key)
+
+    if watch is None or watch.etag is None:
+        status, etag, entries = await run_in_threadpool(_list, username, folder, auth)
+        if entries is None:
+            return None, status
+        watch = _watches.get(key)
+        if watch is None:
+            watch = _watches[key] = _Watch(username, folder, auth)
+        watch.etag, watch.entries = etag, entries
+
+    # Dùng thông tin đăng nhập mới nhất cho các lần probe sau
+    watch.auth = auth
+
+    q = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    watch.subscribers.add(q)
+
+    if _ticker is None:
+        # Ticker dùng chung cho mọi client: không mang request id của client đầu tiên
+        _ticker = contextvars.Context().run(asyncio.ensure_future, _tick())
+
+    return q, {"event": "snapshot", "etag": watch.etag, "entries": list(watch.entries.values())}
+
+
+def unsubscribe(username: str, folder: str, q):
+    key = (username, folder)
+    watch = _watches.get(key)
+    if watch is None:
+        return
+    watch.subscribers.discard(q)
+    if not watch.subscribers:
+        del _watches[key]
+
+
+def forget_user(username: str):
+    """
+    Mật khẩu của user vừa đổi: đóng mọi stream của user (client mở lại bằng
+    mật khẩu mới) và bỏ mật khẩu cũ đang giữ để probe.
+    Gọi được từ thread khác (endpoint sync). Worker khác tự đóng stream khi
+    probe bằng mật khẩu cũ nhận 401.
+    """
+    if _loop is not None and not _loop.is_closed():
+        _loop.call_soon_threadsafe(_drop_user, username)
+
+
+def _drop_user(username: str):
+    for key, watch in list(_watches.items()):
+        if watch.username != username:
+            continue
+        del _watches[key]
+        watch.auth = None
+        for q in list(watch.subscribers):
+            while not q.empty():
+                q.get_nowait()
+            q.put_nowait({"event": "error", "status": 401})
+
+
+def close_all():
+    """
+    Worker bắt đầu tắt: gửi event "shutdown" cho mọi client để stream kết thúc
+    (client kết nối lại sẽ vào worker khác), không chờ hết GRACEFUL_TIMEOUT.
+    """
+    global _closing
+    _closing = True
+    for watch in list(_watches.values()):
+        for q in list(watch.subscribers):
+            while not q.empty():
+                q.get_nowait()
+            q.put_nowait({"event": "shutdown"})
+
+
+def format_event(event: dict) -> str:
+    # Định dạng Server-Sent Events: "event: ...\ndata: ...\n\n"
+    return f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+async def stream(username: str, folder: str, q, snapshot: dict):
+    try:
+        yield format_event(snapshot)
+        while True:
+            try:
+                event = await asyncio.wait_for(q.get(), timeout=HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+
+            yield format_event(event)
+
+            if event["event"] == "shutdown":
+                return
+
+            # Mất quyền truy cập (đổi mật khẩu, folder bị xóa...) -> đóng stream
+            if event["event"] == "error" and event.get("status") in (401, 403, 404):
+                return
+    finally:
+        unsubscribe(username, folder, q)
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic_settings import BaseSettings
 
 
@@ -6,26 +8,43 @@ class Settings(BaseSettings):
     NC_USERNAME: str
     NC_PASSWORD: str
 
-    VNPAY_TMNCODE: str
-    VNPAY_HASH_SECRET_KEY: str
-    VNPAY_PAYMENT_URL: str
-    VNPAY_RETURN_URL: str
+    # Cổng thanh toán được bật, vd: "vnpay,zalopay".
+    # Cấu hình của từng cổng nằm trong module của nó (vnpay.py, momo.py, zalopay.py)
+    # và chỉ được đọc khi cổng đó được dùng lần đầu.
+    PAYMENT_PROVIDERS: str = "vnpay,momo,zalopay"
+
+    # Khóa cho các API /admin/*; để trống = tắt các API này
+    ADMIN_API_KEY: Optional[str] = None
+
+    # Mã máy (0-31) trong ID giao dịch; mỗi máy / container chạy backend cần một
+    # giá trị khác nhau. Bắt buộc khi chạy production (gunicorn.conf.py),
+    # để trống khi dev thì dùng 0.
+    ID_HOST_ID: Optional[int] = None
+
+    # Cache nội dung file tải về trên đĩa (để trống = tắt).
+    # MAX_BYTES tính trên toàn thư mục, dùng chung cho mọi worker.
+    CONTENT_CACHE_DIR: Optional[str] = None
+    CONTENT_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024
+    CONTENT_CACHE_MAX_FILE_BYTES: int = 100 * 1024 * 1024
+
+    # Cache dùng chung giữa các worker: sqlite:///đường/dẫn (mặc định, trong thư mục tạm),
+    # redis://host:6379/0 (cần package redis) hoặc memory:// (chỉ trong process)
+    CACHE_URL: Optional[str] = None
 
-    PARTNER_CODE: str
-    MOMO_ACCESS_KEY: str
-    MOMO_SECRET_KEY: str
-    ENDPOINT: str
-    MOMO_RETURN_URL: str
+    # Khi nhận SIGTERM: số giây worker vẫn nhận request (với /ready = 503)
+    # trước khi ngừng nhận kết nối, để load balancer kịp rút worker ra
+    SHUTDOWN_DRAIN_DELAY: float = 5
 
-    ZALOPAY_APP_ID: str
-    ZALOPAY_KEY1: str
-    ZALOPAY_KEY2: str
-    ZALOPAY_CREATE_ORDER_URL: str
-    ZALOPAY_RETURN_URL: str
-    ZALOPAY_CALLBACK_URL: str
+    # Log dạng JSON ra stdout, qua hàng đợi có giới hạn (đầy thì bỏ bớt log)
+    LOG_LEVEL: str = "INFO"
+    LOG_QUEUE_SIZE: int = 10000
+    # Tỉ lệ giữ log INFO theo route, vd: "/list-files=0.1,/changes=0.05".
+    # WARNING/ERROR luôn được giữ.
+    LOG_SAMPLE_RATES: str = ""
 
     class Config:
         env_file = ".env"
+        extra = "ignore"
 
 
 settings = Settings()
@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from starlette.responses import FileResponse, JSONResponse, StreamingResponse
+
+from config import settings
+from upstream import user_session
+
+# Cache nội dung file trên đĩa, đặt trước WebDAV GET.
+# Key = (namespace, path); mỗi entry lưu kèm ETag để hỏi lại Nextcloud bằng
+# If-None-Match: 304 -> trả file local, 200 -> nội dung mới, ghi đè vào cache.
+# Tắt khi settings.CONTENT_CACHE_DIR để trống.
+CHUNK_SIZE = 64 * 1024
+MAX_INDEX_ENTRIES = 10000
+
+# Tổng dung lượng cache (CONTENT_CACHE_MAX_BYTES) được tính từ các file trên đĩa,
+# nên là giới hạn chung cho mọi worker dùng cùng thư mục.
+# _index chỉ giữ metadata đã đọc trong worker này; file có thể bị worker khác
+# xóa bất cứ lúc nào nên luôn kiểm tra lại trên đĩa trước khi dùng.
+_index = OrderedDict()  # key -> meta
+_lock = Lock()
+
+# File tạm bỏ dở (process bị kill giữa chừng) cũ hơn ngưỡng này thì bị dọn
+STALE_TMP_AGE = 3600
+
+
+def enabled() -> bool:
+    return bool(settings.CONTENT_CACHE_DIR)
+
+
+def _key(namespace: str, path: str) -> str:
+    return hashlib.sha256(f"{namespace}\0{path}".encode("utf-8")).hexdigest()
+
+
+def _data_path(key: str) -> str:
+    return os.path.join(settings.CONTENT_CACHE_DIR, key)
+
+
+def _meta_path(key: str) -> str:
+    return _data_path(key) + ".json"
+
+
+def _read_meta(key: str):
+    try:
+        with open(_meta_path(key), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if os.path.getsize(_data_path(key)) != meta["size"]:
+            return None
+        return meta
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _on_disk(key: str, meta: dict) -> bool:
+    try:
+        return os.path.getsize(_data_path(key)) == meta["size"]
+    except OSError:
+        return False
+
+
+def _remove(key: str):
+    _index.pop(key, None)
+    for path in (_meta_path(key), _data_path(key)):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def _evict():
+    """
+    Quét thư mục cache: nếu tổng dung lượng vượt giới hạn thì xóa các file
+    lâu nhất chưa dùng (atime/mtime, _touch cập nhật khi có hit).
+    Chỉ chạy khi ghi thêm entry mới, không chạy khi đọc.
+    """
+    entries = []
+    total = 0
+    now = time.time()
+    with os.scandir(settings.CONTENT_CACHE_DIR) as it:
+        for item in it:
+            name = item.name
+            try:
+                stat = item.stat()
+            except OSError:
+                continue
+            if name.endswith(".tmp"):
+                if now - stat.st_mtime > STALE_TMP_AGE:
+                    try:
+                        os.unlink(item.path)
+                    except OSError:
+                        pass
+                continue
+            if name.endswith(".json"):
+                continue
+            total += stat.st_size
+            entries.append((max(stat.st_atime, stat.st_mtime), name, stat.st_size))
+
+    entries.sort()
+    for _, key, size in entries:
+        if total <= settings.CONTENT_CACHE_MAX_BYTES:
+            break
+        _remove(key)
+        total -= size
+
+
+def lookup(namespace: str, path: str):
+    key = _key(namespace, path)
+    with _lock:
+        meta = _index.get(key)
+        if meta is None:
+            # Có thể do worker khác ghi vào
+            meta = _read_meta(key)
+        elif not _on_disk(key, meta):
+            # Worker khác đã xóa (evict) file này
+            meta = None
+        if meta is None:
+            _index.pop(key, None)
+            return None
+        _index[key] = meta
+        _index.move_to_end(key)
+        while len(_index) > MAX_INDEX_ENTRIES:
+            _index.popitem(last=False)
+    return {**meta, "key": key}
+
+
+def _touch(key: str):
+    try:
+        os.utime(_data_path(key))
+    except OSError:
+        pass
+
+
+def _store(namespace: str, path: str, etag: str, content_type: str, chunks):
+    """
+    Trả chunk cho client, đồng thời ghi ra file tạm (mỗi lượt tải một file riêng).
+    Chỉ đưa vào cache khi đã nhận đủ; client ngắt giữa chừng thì bỏ file tạm.
+    """
+    key = _key(namespace, path)
+    os.makedirs(settings.CONTENT_CACHE_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=settings.CONTENT_CACHE_DIR, prefix=f"{key}.", suffix=".tmp")
+    size = 0
+    complete = False
+
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                size += len(chunk)
+                if size > settings.CONTENT_CACHE_MAX_FILE_BYTES:
+                    # Quá lớn để cache: vẫn stream tiếp cho client, bỏ ghi
+                    f.close()
+                    os.unlink(tmp)
+                    complete = True
+                    yield chunk
+                    yield from chunks
+                    return
+                f.write(chunk)
+                yield chunk
+        complete = True
+    finally:
+        if not complete:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    meta = {"etag": etag, "size": size, "content_type": content_type, "namespace": namespace, "path": path}
+    with _lock:
+        # Hai lượt tải cùng file xong gần nhau: lượt sau ghi đè lượt trước
+        os.replace(tmp, _data_path(key))
+        with open(_meta_path(key), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        _index[key] = meta
+        try:
+            _evict()
+        except OSError:
+            pass
+
+
+def download(namespace: str, path: str, url: str, auth, filename: str):
+    """
+    GET file qua cache. Trả về Response để endpoint trả thẳng cho client.
+    """
+    cached = lookup(namespace, path) if enabled() else None
+
+    headers = {}
+    if cached is not None:
+        headers["If-None-Match"] = cached["etag"]
+
+    r = user_session().get(url, auth=auth, headers=headers, stream=True)
+
+    download_headers = {
+        "Content-Disposition": f"attachment; filename={filename}"
+    }
+
+    if r.status_code == 304 and cached is not None:
+        r.close()
+        if lookup(namespace, path) is not None:
+            _touch(cached["key"])
+            # FileResponse dùng ASGI pathsend (zero-copy) khi server hỗ trợ
+            return FileResponse(
+                _data_path(cached["key"]),
+                media_type="application/octet-stream",
+                headers=download_headers
+            )
+        # File vừa bị worker khác xóa: GET lại không điều kiện
+        r = user_session().get(url, auth=auth, stream=True)
+
+    if r.status_code != 200:
+        return JSONResponse(status_code=400, content={"error": r.text})
+
+    body = r.iter_content(chunk_size=CHUNK_SIZE)
+
+    etag = r.headers.get("ETag")
+    length = r.headers.get("Content-Length")
+    cacheable = (
+        enabled()
+        and etag
+        and not etag.startswith("W/")
+        and (length is None or int(length) <= settings.CONTENT_CACHE_MAX_FILE_BYTES)
+    )
+    if cacheable:
+        body = _store(namespace, path, etag, r.headers.get("Content-Type"), body)
+
+    return StreamingResponse(
+        body,
+        media_type="application/octet-stream",
+        headers=download_headers
+    )
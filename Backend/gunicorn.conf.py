@@ -0,0 +1,60 @@
+"""
+Cấu hình chạy production:
+
+    gunicorn app:app -c gunicorn.conf.py
+
+Mỗi worker là một process uvicorn (uvloop + httptools nếu đã cài,
+ngược lại tự lùi về asyncio + h11). Tham số lấy từ biến môi trường:
+
+    WEB_CONCURRENCY   số worker (mặc định: số CPU)
+    PORT              cổng (mặc định 8000)
+    GRACEFUL_TIMEOUT  số giây chờ upload/download đang chạy khi tắt (mặc định 120)
+    ID_HOST_ID        bắt buộc, 0-31, khác nhau giữa các máy / container (xem ids.py)
+"""
+import multiprocessing
+import os
+
+import ids
+
+# Dừng ngay nếu thiếu ID_HOST_ID: nhiều container để mặc định sẽ sinh trùng mã đơn hàng
+ids.require_host_id()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# Import app (FastAPI, pydantic, các router) một lần ở process master rồi fork:
+# worker khởi động nhanh hơn và dùng chung trang nhớ chứa code.
+# Những thứ không được dùng chung qua fork (session HTTP, kết nối SQLite
+# của cache, slot worker của ids) đều được tạo lười trong từng worker.
+preload_app = True
+
+# SIGTERM: /ready trả 503, stream /changes được đóng, ngừng nhận kết nối mới,
+# chờ request dở dang tối đa GRACEFUL_TIMEOUT giây rồi mới buộc tắt worker.
+# Upload/download lớn nên xong trong khoảng này.
+# Không dùng max_requests: uvicorn tự dừng worker khi đạt ngưỡng mà không qua
+# tín hiệu, nên stream /changes sẽ giữ worker tới hết GRACEFUL_TIMEOUT.
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", "120"))
+
+# Worker không báo còn sống trong khoảng này thì bị khởi động lại
+timeout = 60
+
+keepalive = 5
+
+# Không ghi access log của gunicorn: dòng request line có cả query string, và
+# RequestLogMiddleware (logs.py) đã ghi mỗi request một dòng JSON (không có query)
+accesslog = None
+errorlog = "-"
+
+# Log của gunicorn (và uvicorn trong worker, vốn chép handler của gunicorn.error)
+# đi qua hàng đợi JSON của logs.py: stdout chỉ có các dòng JSON
+logconfig_dict = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"queue": {"()": "logs.queue_handler"}},
+    "root": {"level": os.environ.get("LOG_LEVEL", "INFO").upper(), "handlers": ["queue"]},
+    "loggers": {
+        "gunicorn.error": {"level": "INFO", "handlers": ["queue"], "propagate": False},
+        "gunicorn.access": {"level": "CRITICAL", "handlers": [], "propagate": False},
+    },
+}
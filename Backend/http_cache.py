@@ -0,0 +1,139 @@
+import gzip
+import hashlib
+import json
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# Body nhỏ hơn ngưỡng này thì nén không đáng (header + CPU > phần tiết kiệm)
+MIN_COMPRESS_SIZE = 1024
+
+
+def _compress_zstd(body: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=3).compress(body)
+
+
+def _compress_br(body: bytes) -> bytes:
+    return brotli.compress(body, quality=4)
+
+
+def _compress_gzip(body: bytes) -> bytes:
+    return gzip.compress(body, compresslevel=6)
+
+
+def _available_encoders():
+    # Thứ tự = ưu tiên của server khi client chấp nhận nhiều encoding ngang nhau
+    encoders = []
+    if zstandard is not None:
+        encoders.append(("zstd", _compress_zstd))
+    if brotli is not None:
+        encoders.append(("br", _compress_br))
+    encoders.append(("gzip", _compress_gzip))
+    return encoders
+
+
+ENCODERS = _available_encoders()
+
+
+def parse_accept_encoding(header: str) -> dict:
+    """
+    "gzip;q=0.8, br, *;q=0" -> {"gzip": 0.8, "br": 1.0, "*": 0.0}
+    """
+    accepted = {}
+    for item in header.split(","):
+        parts = item.strip().split(";")
+        coding = parts[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            name, _, value = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(header: str):
+    accepted = parse_accept_encoding(header or "")
+    best, best_q = None, 0.0
+    for coding, encoder in ENCODERS:
+        q = accepted.get(coding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = (coding, encoder), q
+    return best
+
+
+def make_etag(*parts) -> str:
+    # Weak ETag: cùng nội dung có thể được gửi với encoding khác nhau
+    digest = hashlib.sha1("\0".join(str(p) for p in parts).encode()).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # So sánh weak: bỏ tiền tố W/
+    wanted = etag.removeprefix("W/")
+    return any(
+        tag.strip().removeprefix("W/") == wanted
+        for tag in if_none_match.split(",")
+    )
+
+
+def json_response(request: Request, content, status_code: int = 200, etag_source=None) -> Response:
+    """
+    JSON response có ETag + nén theo Accept-Encoding.
+    - etag_source: validator từ upstream (vd: ETag folder của Nextcloud).
+      Nếu không có thì ETag được tính từ nội dung.
+    - If-None-Match khớp -> 304 không body.
+    """
+    vary = {"Vary": "Accept-Encoding"}
+
+    if etag_source is not None:
+        etag = make_etag(etag_source)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag, **vary})
+
+    body = json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+    if etag_source is None:
+        etag = make_etag(hashlib.sha1(body).hexdigest())
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag, **vary})
+
+    headers = {"ETag": etag, **vary}
+
+    if len(body) >= MIN_COMPRESS_SIZE:
+        chosen = choose_encoding(request.headers.get("accept-encoding"))
+        if chosen is not None:
+            coding, encoder = chosen
+            body = encoder(body)
+            headers["Content-Encoding"] = coding
+
+    return Response(
+        content=body,
+        status_code=status_code,
+        headers=headers,
+        media_type="application/json",
+    )
@@ -0,0 +1,141 @@
+import datetime
+import itertools
+import os
+import tempfile
+import time
+from threading import Lock
+
+from config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# ID kiểu snowflake (64 bit):
+#   41 bit: millisecond kể từ EPOCH_MS
+#   12 bit: sequence trong millisecond
+#    5 bit: host (settings.ID_HOST_ID)
+#    5 bit: worker trên host (tự nhận slot qua file lock)
+# File lock nằm trong thư mục tạm của máy / container: các container (kể cả
+# trên cùng một máy) không thấy lock của nhau, nên mỗi container cần ID_HOST_ID riêng.
+# Host/worker nằm ở bit thấp để phần (millisecond, sequence) là một bộ đếm liền mạch.
+EPOCH_MS = 1735689600000  # 2025-01-01 00:00:00 UTC
+
+SEQUENCE_BITS = 12
+HOST_BITS = 5
+WORKER_BITS = 5
+
+MAX_WORKERS = 1 << WORKER_BITS
+
+# Ngày trong app_trans_id của ZaloPay phải theo giờ Việt Nam
+VN_TZ = datetime.timezone(datetime.timedelta(hours=7))
+
+_slot_file = None
+
+
+def _claim_worker_slot() -> int:
+    """
+    Mỗi process giữ flock trên một file slot-N trong thư mục tạm cho tới khi thoát,
+    nên các worker trên cùng máy luôn có slot khác nhau (kể cả khi restart).
+    """
+    global _slot_file
+    if fcntl is None:
+        return os.getpid() % MAX_WORKERS
+
+    lock_dir = os.path.join(tempfile.gettempdir(), "backend-id-slots")
+    os.makedirs(lock_dir, exist_ok=True)
+
+    for slot in range(MAX_WORKERS):
+        f = open(os.path.join(lock_dir, f"slot-{slot}"), "w")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            continue
+        _slot_file = f
+        return slot
+
+    raise RuntimeError(f"More than {MAX_WORKERS} workers on this host: no free ID slot")
+
+
+def require_host_id() -> int:
+    """
+    ID_HOST_ID phải được đặt rõ ràng (gọi khi chạy production):
+    để mặc định thì mọi máy / container đều là host 0 và trùng ID với nhau.
+    """
+    host = settings.ID_HOST_ID
+    if host is None:
+        raise RuntimeError(
+            "ID_HOST_ID is not set: give every host / container running the backend "
+            f"its own value in 0-{(1 << HOST_BITS) - 1}"
+        )
+    if not 0 <= host < 1 << HOST_BITS:
+        raise RuntimeError(f"ID_HOST_ID must be in 0-{(1 << HOST_BITS) - 1}, got {host}")
+    return host
+
+
+_worker_id = None
+# Giá trị của bộ đếm = (millisecond << SEQUENCE_BITS) | sequence
+_counter = itertools.count(0)
+_reseed_lock = Lock()
+
+
+def worker_id() -> int:
+    global _worker_id
+    if _worker_id is None:
+        # Dev (uvicorn, một máy): không đặt ID_HOST_ID thì dùng host 0
+        host = require_host_id() if settings.ID_HOST_ID is not None else 0
+        _worker_id = (host << WORKER_BITS) | _claim_worker_slot()
+    return _worker_id
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000) - EPOCH_MS
+
+
+def _reseed(now: int) -> int:
+    # Bộ đếm đang chậm hơn đồng hồ: nhảy lên millisecond hiện tại.
+    # Chỉ chạy tối đa một lần mỗi millisecond.
+    global _counter
+    with _reseed_lock:
+        value = next(_counter)
+        if value >> SEQUENCE_BITS < now:
+            _counter = itertools.count(now << SEQUENCE_BITS)
+            value = next(_counter)
+        return value
+
+
+def next_id() -> int:
+    """
+    ID duy nhất giữa các worker, tăng dần theo thời gian.
+    Đường chính không có lock: itertools.count() là atomic dưới GIL.
+    Hết 4096 sequence trong một millisecond thì sequence tràn sang millisecond kế
+    (không chờ), đồng hồ bị chỉnh lùi thì bộ đếm vẫn tiếp tục tăng.
+    """
+    worker = _worker_id if _worker_id is not None else worker_id()
+
+    value = next(_counter)
+    now = _now_ms()
+    if value >> SEQUENCE_BITS < now:
+        value = _reseed(now)
+
+    return (value << (HOST_BITS + WORKER_BITS)) | worker
+
+
+# -----------------------
+# Định dạng theo từng cổng thanh toán
+# -----------------------
+def vnpay_txn_ref() -> str:
+    # vnp_TxnRef: chữ + số, duy nhất trong ngày, tối đa 100 ký tự
+    return str(next_id())
+
+
+def momo_order_id() -> str:
+    # orderId: ^[0-9a-zA-Z]([-_.]*[0-9a-zA-Z]+)*$, tối đa 50 ký tự
+    return f"MOMO{next_id()}"
+
+
+def zalopay_trans_id() -> str:
+    # app_trans_id: yymmdd_xxx (ngày giờ VN), tối đa 40 ký tự
+    return f"{datetime.datetime.now(VN_TZ).strftime('%y%m%d')}_{next_id()}"
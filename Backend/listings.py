@@ -0,0 +1,266 @@
+import base64
+import hashlib
+import json
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from threading import Lock
+
+import accounts
+import analytics
+import cache
+from webdav import propfind, parse_listing, probe_etag, relative_path
+
+# Listing của một folder được cache theo ETag của folder (ETag đổi khi có
+# file con thay đổi), cùng với các "view" đã lọc + sắp xếp của listing đó.
+# Các trang tiếp theo (có cursor) đọc thẳng từ view, không gọi Nextcloud
+# và không sắp xếp lại.
+LISTING_TTL = 300
+MAX_PAGE_SIZE = 1000
+
+# View đã giải mã giữ lại trong process, trước cache dùng chung: các trang
+# tiếp theo không phải json.loads cả view mỗi lần. View của một ETag không đổi
+# nên chỉ cần so ETag, không cần invalidation.
+LOCAL_VIEWS = 64
+
+_local_views = OrderedDict()  # (username, view_id) -> view
+_local_lock = Lock()
+
+SORT_KEYS = {
+    "name": lambda row: row["sort_name"],
+    "size": lambda row: row["size"],
+    "modified": lambda row: row["mtime"],
+    "type": lambda row: row["type"],
+}
+
+# Field trả về cho client (giữ nguyên định dạng cũ của /list-files)
+FILE_FIELDS = ("path", "name", "size", "last_modified", "type")
+
+
+class ListingError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+def parse_sort(raw: str) -> list:
+    """
+    "name" / "-size,name" -> [("size", True), ("name", False)]; dấu "-" = giảm dần.
+    """
+    keys = []
+    for item in (raw or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        descending = item.startswith("-")
+        key = item.lstrip("-")
+        if key not in SORT_KEYS:
+            raise ListingError(400, f"Unknown sort key {key}, use one of: {', '.join(SORT_KEYS)}")
+        keys.append((key, descending))
+    return keys
+
+
+def parse_types(raw: str) -> list:
+    """
+    "folder,image/*,application/pdf" -> danh sách filter (đã sắp xếp, không trùng).
+    """
+    return sorted({item.strip().lower() for item in (raw or "").split(",") if item.strip()})
+
+
+def _matches(row: dict, types: list) -> bool:
+    for t in types:
+        if t == "folder":
+            if row["folder"]:
+                return True
+        elif row["folder"]:
+            continue
+        elif t.endswith("/*") or t.endswith("/"):
+            if row["type"].lower().startswith(t.rstrip("*")):
+                return True
+        elif row["type"].lower() == t:
+            return True
+    return False
+
+
+def _mtime(value) -> float:
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _base_key(username: str, folder: str) -> str:
+    return f"listing:{username}:{folder}"
+
+
+def _view_key(username: str, view_id: str) -> str:
+    return f"listing-view:{username}:{view_id}"
+
+
+def view_id(folder: str, sort: list, types: list) -> str:
+    raw = json.dumps([folder, sort, types], separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def encode_cursor(etag: str, offset: int, vid: str) -> str:
+    raw = json.dumps([etag, offset, vid], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        etag, offset, vid = json.loads(raw)
+        if not isinstance(offset, int) or offset < 0:
+            raise ValueError(offset)
+        return etag, offset, vid
+    except (ValueError, TypeError):
+        raise ListingError(400, "Invalid cursor")
+
+
+def _local_get(username: str, vid: str, etag: str = None):
+    """
+    View trong process; etag=None: bản mới nhất đang giữ (chưa kiểm tra với Nextcloud).
+    """
+    with _local_lock:
+        view = _local_views.get((username, vid))
+        if view is None or (etag is not None and view["etag"] != etag):
+            return None
+        _local_views.move_to_end((username, vid))
+        return view
+
+
+def _remember_view(username: str, vid: str, view: dict):
+    with _local_lock:
+        _local_views[(username, vid)] = view
+        _local_views.move_to_end((username, vid))
+        while len(_local_views) > LOCAL_VIEWS:
+            _local_views.popitem(last=False)
+
+
+def _store_view(username: str, key: str, vid: str, view: dict):
+    cache.set(key, view, LISTING_TTL)
+    _remember_view(username, vid, view)
+
+
+def _fetch_base(username: str, auth, folder: str) -> dict:
+    """
+    PROPFIND Depth 1 rồi lưu listing (theo thứ tự Nextcloud trả về) vào cache.
+    """
+    response = propfind(username, auth, folder)
+    if response.status_code != 207:
+        raise ListingError(400, response.text)
+
+    folder_entry, entries = parse_listing(response.text, username, folder)
+    analytics.observe_listing(username, folder, folder_entry, entries)
+
+    rows = []
+    for entry in entries:
+        rows.append({
+            "path": entry["href"],
+            "name": entry["href"].split("/")[-1],
+            "size": entry["size"],
+            "last_modified": entry["last_modified"],
+            "type": entry["type"] or "folder",
+            "folder": entry["is_folder"],
+            "sort_name": relative_path(entry["href"], username).rsplit("/", 1)[-1].casefold(),
+            "mtime": _mtime(entry["last_modified"]),
+        })
+
+    base = {"etag": folder_entry["etag"] if folder_entry else None, "rows": rows}
+    if base["etag"]:
+        cache.set(_base_key(username, folder), base, LISTING_TTL)
+    return base
+
+
+def _build_view(base: dict, sort: list, types: list) -> dict:
+    rows = base["rows"]
+    if types:
+        rows = [row for row in rows if _matches(row, types)]
+    else:
+        rows = list(rows)
+
+    # Sort ổn định: sắp theo key phụ trước, key chính sau cùng
+    for key, descending in reversed(sort):
+        rows.sort(key=SORT_KEYS[key], reverse=descending)
+
+    return {
+        "etag": base["etag"],
+        "files": [{field: row[field] for field in FILE_FIELDS} for row in rows],
+    }
+
+
+def _current_base(username: str, auth, folder: str, etag: str) -> dict:
+    # Đã biết ETag hiện tại (qua probe): dùng lại listing trong cache nếu khớp
+    base = cache.get(_base_key(username, folder))
+    if base is not None and base["etag"] == etag:
+        return base
+    return _fetch_base(username, auth, folder)
+
+
+def get_view(username: str, password: str, folder: str, sort: list, types: list, cursor: str = None):
+    """
+    (view, offset). view = {"etag", "files"}: listing đã lọc + sắp xếp của folder.
+    - Không có cursor: luôn hỏi Nextcloud (1 lệnh) xem folder có đổi không.
+    - Có cursor: đọc view đã cache nếu còn đúng ETag trong cursor; chỉ kiểm tra
+      mật khẩu qua cache thông tin đăng nhập (accounts).
+    """
+    auth = (username, password)
+    vid = view_id(folder, sort, types)
+    key = _view_key(username, vid)
+
+    if cursor:
+        etag, offset, cursor_vid = decode_cursor(cursor)
+        if cursor_vid != vid:
+            raise ListingError(400, "Cursor does not match folder / sort / type")
+        if not accounts.check_credentials(username, password):
+            raise ListingError(401, "Invalid credentials")
+
+        view = _local_get(username, vid, etag)
+        if view is not None:
+            return view, offset
+
+        view = cache.get(key)
+        if view is not None and view["etag"] == etag:
+            _remember_view(username, vid, view)
+            return view, offset
+
+        # View đã hết hạn trong cache: dựng lại nếu folder chưa đổi
+        base = _fetch_base(username, auth, folder)
+        if base["etag"] != etag:
+            raise ListingError(410, "Folder changed since this cursor was issued, reload the first page")
+        view = _build_view(base, sort, types)
+        _store_view(username, key, vid, view)
+        return view, offset
+
+    view = _local_get(username, vid) or cache.get(key)
+    if view is None and cache.get(_base_key(username, folder)) is None:
+        base = _fetch_base(username, auth, folder)
+    else:
+        # Có listing trong cache: PROPFIND Depth 0 chỉ để so ETag
+        status, etag = probe_etag(username, auth, folder)
+        if status != 207:
+            raise ListingError(400, f"Cannot list {folder}")
+        if view is not None and view["etag"] != etag:
+            # Bản trong process đã cũ: worker khác có thể đã lưu bản mới
+            view = cache.get(key)
+        if view is not None and view["etag"] == etag:
+            _remember_view(username, vid, view)
+            return view, 0
+        base = _current_base(username, auth, folder, etag)
+
+    view = _build_view(base, sort, types)
+    if view["etag"]:
+        _store_view(username, key, vid, view)
+    return view, 0
+
+
+def page(view: dict, offset: int, page_size, vid: str) -> dict:
+    files = view["files"]
+    end = len(files) if page_size is None else offset + page_size
+    next_cursor = encode_cursor(view["etag"], end, vid) if end < len(files) else None
+    return {
+        "files": files[offset:end],
+        "total": len(files),
+        "next_cursor": next_cursor,
+    }
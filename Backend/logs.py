@@ -0,0 +1,244 @@
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import time
+import traceback
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+
+from config import settings
+
+# Log JSON, mỗi dòng một record. Thread xử lý request chỉ đưa record vào
+# hàng đợi (không format, không ghi); một thread nền ghi ra stdout.
+# Hàng đợi đầy (stdout chậm) thì record bị bỏ và được đếm lại.
+
+REQUEST_ID_HEADER = "x-request-id"
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+_sampled = contextvars.ContextVar("log_sampled", default=True)
+
+# Thuộc tính có sẵn của LogRecord; còn lại (truyền qua extra=) là field của log.
+# color_message: bản có mã màu ANSI mà uvicorn gắn vào một số log
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "request_id", "color_message"}
+
+logger = logging.getLogger("http")
+
+_handler = None
+_listener = None
+_output = None
+
+
+def request_id():
+    return _request_id.get()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+            .isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = "".join(traceback.format_exception(*record.exc_info))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _ContextFilter(logging.Filter):
+    """
+    Chạy ở thread gọi log: gắn request_id, bỏ log INFO/DEBUG của request
+    không được lấy mẫu.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING and not _sampled.get():
+            return False
+        record.request_id = _request_id.get()
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Không format ở đây: chỉ gộp args vào msg để record đọc được ở thread khác
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if _listener is None:
+            # Đã shutdown(): ghi thẳng, không còn thread nền
+            _output.handle(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            warning = logging.makeLogRecord({
+                "name": "logs", "levelno": logging.WARNING, "levelname": "WARNING",
+                "msg": "log queue was full, records dropped", "dropped": dropped,
+            })
+            try:
+                self.queue.put_nowait(warning)
+            except queue.Full:
+                self.dropped += dropped
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Hàng đợi có thể đang đầy: chờ chỗ trống thay vì bỏ sentinel
+        self.queue.put(self._sentinel)
+
+
+def parse_sample_rates(raw: str) -> dict:
+    """
+    "/list-files=0.1,/changes=0.05" -> {"/list-files": 0.1, "/changes": 0.05}
+    """
+    rates = {}
+    for item in raw.split(","):
+        path, sep, rate = item.strip().partition("=")
+        if sep and path:
+            rates[path.strip()] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+def _start_listener():
+    global _listener, _output
+    q = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    _handler.queue = q
+
+    _output = logging.StreamHandler(sys.stdout)
+    _output.setFormatter(JsonFormatter())
+    _listener = _Listener(q, _output, respect_handler_level=False)
+    _listener.start()
+
+
+def _after_fork():
+    # Thread ghi log không tồn tại trong process con (gunicorn preload):
+    # tạo lại hàng đợi + thread mới
+    if _handler is not None:
+        _start_listener()
+
+
+def setup():
+    """
+    Chuyển mọi log (kể cả của thư viện và của uvicorn) qua hàng đợi.
+    Gọi một lần khi import app (hoặc từ logconfig_dict của gunicorn).
+    """
+    global _handler
+    if _handler is not None:
+        return
+
+    _handler = DroppingQueueHandler(None)
+    _handler.addFilter(_ContextFilter())
+    _start_listener()
+
+    root = logging.getLogger()
+    root.handlers = [_handler]
+    root.setLevel(settings.LOG_LEVEL.upper())
+
+    # uvicorn tự gắn handler ghi text vào logger của nó trước khi import app
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = [_handler]
+        uvicorn_logger.propagate = False
+    # Access log của uvicorn trùng với dòng log của RequestLogMiddleware
+    logging.getLogger("uvicorn.access").setLevel(logging.WARNING)
+
+    os.register_at_fork(after_in_child=_after_fork)
+    atexit.register(shutdown)
+
+
+def queue_handler() -> logging.Handler:
+    """
+    Handler của hàng đợi, cho logconfig_dict trong gunicorn.conf.py.
+    """
+    setup()
+    return _handler
+
+
+def shutdown():
+    """
+    Ghi nốt các log còn trong hàng đợi; log phát ra sau đó (uvicorn, gunicorn
+    báo tắt) được ghi thẳng ra stdout.
+    """
+    global _listener
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
+
+
+class RequestLogMiddleware:
+    """
+    ASGI middleware: gán request id (lấy từ header X-Request-ID nếu hợp lệ),
+    trả lại trong response, và ghi một dòng log cho mỗi request khi xong.
+    """
+
+    def __init__(self, app, sample_rates: dict = None):
+        self.app = app
+        self.sample_rates = sample_rates or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope["headers"]).get(REQUEST_ID_HEADER.encode(), b"").decode("latin-1")
+        rid = incoming if _REQUEST_ID_RE.match(incoming) else uuid.uuid4().hex
+
+        rate = self.sample_rates.get(scope["path"], 1.0)
+        tokens = (_request_id.set(rid), _sampled.set(rate >= 1.0 or random.random() < rate))
+
+        started = time.perf_counter()
+        status = None
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {
+                    **message,
+                    "headers": list(message.get("headers", [])) + [(REQUEST_ID_HEADER.encode(), rid.encode())]
+                }
+            await send(message)
+
+        fields = {"method": scope["method"], "path": scope["path"]}
+        try:
+            await self.app(scope, receive, send_with_id)
+        except Exception:
+            logger.exception("request failed", extra=fields)
+            raise
+        else:
+            level = logging.WARNING if status is None or status >= 500 else logging.INFO
+            logger.log(level, "request", extra={
+                **fields,
+                "status": status,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            })
+        finally:
+            _request_id.reset(tokens[0])
+            _sampled.reset(tokens[1])
@@ -0,0 +1,32 @@
+import os
+import sys
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def rss_bytes():
+    """
+    RSS hiện tại của process (bytes). None nếu không đo được.
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+
+    if resource is None:
+        return None
+
+    # Không có /proc (macOS...): dùng peak RSS thay thế
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def format_mb(nbytes) -> str:
+    if nbytes is None:
+        return "n/a"
+    return f"{nbytes / (1024 * 1024):.1f} MB"
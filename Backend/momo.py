@@ -1,9 +1,36 @@
-import hmac
-import hashlib
-
-def create_momo_signature(raw_signature: str, secret_key: str):
-    return hmac.new(
-        secret_key.encode(),
-        raw_signature.encode(),
-        hashlib.sha256
-    ).hexdigest()
+from pydantic_settings import BaseSettings
+
+from signing import get_signer, momo_canonical, MOMO_CREATE_FIELDS, MOMO_IPN_FIELDS
+
+
+class MomoSettings(BaseSettings):
+    PARTNER_CODE: str
+    MOMO_ACCESS_KEY: str
+    MOMO_SECRET_KEY: str
+    ENDPOINT: str
+    MOMO_RETURN_URL: str
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+
+settings = MomoSettings()
+
+
+def create_momo_signature(payload: dict) -> str:
+    """
+    Dùng cho API tạo thanh toán
+    """
+    signer = get_signer(settings.MOMO_SECRET_KEY, "sha256")
+    return signer.sign(momo_canonical(payload, MOMO_CREATE_FIELDS))
+
+
+def verify_momo_ipn(data: dict) -> bool:
+    """
+    Dùng cho IPN (notify) từ MoMo.
+    IPN không gửi accessKey: chuỗi ký dùng accessKey của chính merchant.
+    """
+    signer = get_signer(settings.MOMO_SECRET_KEY, "sha256")
+    signed = {**data, "accessKey": settings.MOMO_ACCESS_KEY}
+    return signer.verify(momo_canonical(signed, MOMO_IPN_FIELDS), data.get("signature"))
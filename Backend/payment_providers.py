@@ -0,0 +1,82 @@
+import importlib
+import logging
+import time
+from threading import Lock
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+from config import settings
+from metrics import rss_bytes, format_mb
+
+# Tên cổng thanh toán -> module chứa settings + hàm ký của cổng đó.
+# Module chỉ được import khi cổng được dùng lần đầu.
+PROVIDERS = {
+    "vnpay": "vnpay",
+    "momo": "momo",
+    "zalopay": "zalopay",
+}
+
+logger = logging.getLogger("payments")
+
+_loaded = {}
+_load_lock = Lock()
+
+
+def enabled_providers() -> list:
+    names = [
+        name.strip().lower()
+        for name in settings.PAYMENT_PROVIDERS.split(",")
+        if name.strip()
+    ]
+    return [name for name in names if name in PROVIDERS]
+
+
+def unknown_providers() -> list:
+    return [
+        name.strip()
+        for name in settings.PAYMENT_PROVIDERS.split(",")
+        if name.strip() and name.strip().lower() not in PROVIDERS
+    ]
+
+
+def get_provider(name: str):
+    """
+    Trả về module của cổng thanh toán, import + đọc cấu hình ở lần gọi đầu.
+    - Cổng không bật -> 404
+    - Cổng bật nhưng thiếu biến môi trường -> 503
+    """
+    module = _loaded.get(name)
+    if module is not None:
+        return module
+
+    if name not in enabled_providers():
+        raise HTTPException(status_code=404, detail=f"Payment provider '{name}' is not enabled")
+
+    with _load_lock:
+        module = _loaded.get(name)
+        if module is not None:
+            return module
+
+        rss_before = rss_bytes()
+        started = time.perf_counter()
+        try:
+            module = importlib.import_module(PROVIDERS[name])
+        except ValidationError as e:
+            missing = ", ".join(str(err["loc"][0]) for err in e.errors())
+            logger.error("payment provider is enabled but not configured", extra={"provider": name, "missing": missing})
+            raise HTTPException(status_code=503, detail=f"Payment provider '{name}' is not configured")
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        rss_after = rss_bytes()
+        rss_delta = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+        logger.info("payment provider loaded", extra={
+            "provider": name, "elapsed_ms": round(elapsed_ms, 1), "rss_delta": format_mb(rss_delta)
+        })
+
+        _loaded[name] = module
+        return module
+
+
+def loaded_providers() -> list:
+    return list(_loaded)
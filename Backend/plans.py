@@ -0,0 +1,9 @@
+import json
+from functools import lru_cache
+
+
+@lru_cache(maxsize=1)
+def get_plans() -> dict:
+    # Chỉ đọc plans.json khi có request thanh toán / nâng cấp đầu tiên
+    with open("plans.json", "r", encoding="utf-8") as f:
+        return json.load(f)["plans"]
@@ -0,0 +1,115 @@
+import time
+
+import accounts
+import cache
+
+# Record quota được dùng lại trong khoảng này (giây), sau đó lấy lại từ Nextcloud.
+# Giữa hai lần lấy, dung lượng trống được cộng/trừ tại chỗ khi upload/xóa xong.
+QUOTA_TTL = 300
+
+# Khi record cũ hơn ngưỡng này thì lấy lại trước khi từ chối upload,
+# tránh từ chối nhầm vì user vừa dọn dẹp từ giao diện Nextcloud.
+RECHECK_AFTER = 10
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+def _key(username: str) -> str:
+    return f"quota:{username}"
+
+
+def remember(username: str, quota: dict):
+    """
+    Lưu phần "quota" trong record OCS /cloud/user của user.
+    """
+    cache.set(_key(username), {
+        "free": quota.get("free"),
+        "used": quota.get("used", 0),
+        "total": quota.get("quota"),
+        "fetched_at": time.time(),
+    }, QUOTA_TTL)
+
+
+def fetch(username: str, auth):
+    data = accounts.fetch_user_info(*auth)
+    if data is None:
+        return None
+
+    remember(username, data["quota"])
+    return get_cached(username)
+
+
+def get_cached(username: str):
+    return cache.get(_key(username))
+
+
+def get_record(username: str, auth):
+    """
+    Record quota của user, từ cache nếu còn mới.
+    None nếu sai thông tin đăng nhập.
+    """
+    if not accounts.check_credentials(*auth):
+        return None
+    return get_cached(username) or fetch(username, auth)
+
+
+def free_bytes(record):
+    """
+    Số byte còn trống; None nếu Nextcloud không báo (quota không giới hạn).
+    """
+    free = record.get("free") if record else None
+    if free is None or free < 0:
+        return None
+    return free
+
+
+def check_fits(username: str, auth, nbytes: int):
+    """
+    (fits, free) - có đủ chỗ cho nbytes không.
+    Chỉ trả fits=False sau khi đã đối chiếu với record đủ mới.
+    """
+    record = get_record(username, auth)
+    if record is None:
+        return None, None
+
+    free = free_bytes(record)
+    if free is None or nbytes <= free:
+        return True, free
+
+    if time.time() - record["fetched_at"] > RECHECK_AFTER:
+        record = fetch(username, auth)
+        if record is None:
+            return None, None
+        free = free_bytes(record)
+        if free is None or nbytes <= free:
+            return True, free
+
+    return False, free
+
+
+def _adjust(username: str, delta: int):
+    # Đọc - sửa - ghi: hai worker ghi cùng lúc có thể lệch một chút,
+    # nhưng record luôn được lấy lại trước khi từ chối upload (check_fits).
+    record = get_cached(username)
+    if record is None:
+        return
+    record["used"] = max(record["used"] + delta, 0)
+    if record["free"] is not None and record["free"] >= 0:
+        record["free"] = max(record["free"] - delta, 0)
+    ttl = QUOTA_TTL - (time.time() - record["fetched_at"])
+    if ttl > 0:
+        cache.set(_key(username), record, ttl)
+
+
+def consume(username: str, nbytes: int):
+    _adjust(username, nbytes)
+
+
+def release(username: str, nbytes: int):
+    _adjust(username, -nbytes)
+
+
+def invalidate(username: str):
+    cache.delete(_key(username))
@@ -1,10 +1,21 @@
-from fastapi import APIRouter, Form
+from urllib.parse import quote
+
+from fastapi import APIRouter, Form, Request
 from starlette.responses import JSONResponse
 import requests
+import accounts
+import cache
+import content_cache
 from config import settings
+from http_cache import json_response
+from upstream import user_session
 
 router = APIRouter()
 
+# Danh sách share theo path của mỗi user được cache bao lâu (giây);
+# tạo/xóa share qua API này sẽ xóa cache ngay
+SHARES_TTL = 60
+
 # -----------------------
 # Helpers
 # -----------------------
@@ -35,6 +46,14 @@ def ocs_headers():
     }
 
 
+def shares_key(username: str) -> str:
+    return f"shares:{username}"
+
+
+def invalidate_shares(username: str):
+    cache.delete(shares_key(username))
+
+
 def ocs_error(resp):
     try:
         data = resp.json()
@@ -71,11 +90,12 @@ def share_file(
     if expire_date:
         payload["expireDate"] = expire_date
 
-    r = requests.post(url, headers=ocs_headers(), data=payload, auth=auth)
+    r = user_session().post(url, headers=ocs_headers(), data=payload, auth=auth)
 
     if r.status_code not in (200, 201):
         return JSONResponse(status_code=400, content={"error": ocs_error(r)})
 
+    invalidate_shares(username)
     data = r.json()["ocs"]["data"]
 
     return {
@@ -110,11 +130,12 @@ def share_to_user(
         "permissions": permissions(can_edit)
     }
 
-    r = requests.post(url, headers=ocs_headers(), data=payload, auth=auth)
+    r = user_session().post(url, headers=ocs_headers(), data=payload, auth=auth)
 
     if r.status_code not in (200, 201):
         return JSONResponse(status_code=400, content={"error": ocs_error(r)})
 
+    invalidate_shares(username)
     return r.json()["ocs"]["data"]
 
 
@@ -123,6 +144,7 @@ def share_to_user(
 # -----------------------
 @router.post("/list-shares")
 def list_shares(
+    request: Request,
     username: str = Form(...),
     password: str = Form(...),
     filepath: str = Form(...)
@@ -136,12 +158,24 @@ def list_shares(
         f"?path={path}&reshares=true"
     )
 
-    r = requests.get(url, headers=ocs_headers(), auth=auth)
+    key = shares_key(username)
+    cached = cache.get(key)
+    if accounts.credentials_match(cached, username, password) and path in cached["paths"]:
+        return json_response(request, cached["paths"][path])
+
+    r = user_session().get(url, headers=ocs_headers(), auth=auth)
 
     if r.status_code != 200:
         return JSONResponse(status_code=400, content={"error": ocs_error(r)})
 
-    return r.json()["ocs"]["data"]
+    data = r.json()["ocs"]["data"]
+
+    if not accounts.credentials_match(cached, username, password):
+        cached = {"digest": accounts.credential_digest(username, password), "paths": {}}
+    cached["paths"][path] = data
+    cache.set(key, cached, SHARES_TTL)
+
+    return json_response(request, data)
 
 
 # -----------------------
@@ -160,9 +194,35 @@ def delete_share(
         f"/ocs/v2.php/apps/files_sharing/api/v1/shares/{share_id}"
     )
 
-    r = requests.delete(url, headers=ocs_headers(), auth=auth)
+    r = user_session().delete(url, headers=ocs_headers(), auth=auth)
 
     if r.status_code not in (200, 204):
         return JSONResponse(status_code=400, content={"error": ocs_error(r)})
 
+    invalidate_shares(username)
     return {"status": "success"}
+
+
+# -----------------------
+# DOWNLOAD PUBLIC SHARE
+# -----------------------
+@router.post("/public-download")
+def public_download(
+    token: str = Form(...),
+    share_password: str = Form(None),
+    filepath: str = Form("")
+):
+    """
+    Tải file từ link share công khai (không cần tài khoản).
+    - token: phần cuối của link share (/s/<token>)
+    - filepath: đường dẫn bên trong share nếu share là folder
+    """
+    path = normalize_path("", filepath)
+    url = f"{settings.NEXTCLOUD_URL}/public.php/webdav{quote(path)}"
+
+    filename = path.rstrip("/").split("/")[-1] or token
+
+    # public WebDAV: username = token, password = mật khẩu share (nếu có)
+    return content_cache.download(
+        f"share:{token}", path, url, (token, share_password or ""), filename
+    )
@@ -0,0 +1,65 @@
+import hmac
+from functools import lru_cache
+from urllib.parse import quote_plus
+
+# Thứ tự field trong chuỗi ký của từng cổng (theo tài liệu của cổng)
+MOMO_CREATE_FIELDS = (
+    "accessKey", "amount", "extraData", "ipnUrl", "orderId", "orderInfo",
+    "partnerCode", "redirectUrl", "requestId", "requestType",
+)
+MOMO_IPN_FIELDS = (
+    "accessKey", "amount", "extraData", "message", "orderId", "orderInfo", "orderType",
+    "partnerCode", "payType", "requestId", "responseTime", "resultCode", "transId",
+)
+ZALOPAY_CREATE_FIELDS = (
+    "app_id", "app_trans_id", "app_user", "amount", "app_time", "embed_data", "item",
+)
+VNPAY_HASH_FIELDS = ("vnp_SecureHash", "vnp_SecureHashType")
+
+
+class Signer:
+    """
+    HMAC đã nạp sẵn key: mỗi lần ký chỉ copy() state đã băm key,
+    không phải dựng lại HMAC (pad + băm key) từ đầu.
+    """
+
+    def __init__(self, key: str, digestmod: str):
+        self._keyed = hmac.new(key.encode("utf-8"), digestmod=digestmod)
+
+    def sign(self, message: str) -> str:
+        h = self._keyed.copy()
+        h.update(message.encode("utf-8"))
+        return h.hexdigest()
+
+    def verify(self, message: str, signature) -> bool:
+        if not isinstance(signature, str):
+            return False
+        # compare_digest: thời gian so sánh không phụ thuộc vị trí ký tự sai
+        return hmac.compare_digest(self.sign(message).encode(), signature.lower().encode())
+
+
+@lru_cache(maxsize=32)
+def get_signer(key: str, digestmod: str) -> Signer:
+    return Signer(key, digestmod)
+
+
+# -----------------------
+# Chuỗi ký chuẩn của từng cổng
+# -----------------------
+def momo_canonical(data: dict, fields=MOMO_CREATE_FIELDS) -> str:
+    # accessKey=...&amount=...&... theo đúng thứ tự khai báo
+    return "&".join(f"{field}={data.get(field, '')}" for field in fields)
+
+
+def zalopay_canonical(data: dict, fields=ZALOPAY_CREATE_FIELDS) -> str:
+    # app_id|app_trans_id|app_user|amount|app_time|embed_data|item
+    return "|".join(str(data[field]) for field in fields)
+
+
+def vnpay_canonical(params: dict) -> str:
+    # Sort theo tên, bỏ field rỗng và field chữ ký, encode KHỚP 100% với URL
+    return "&".join(
+        f"{k}={quote_plus(str(v))}"
+        for k, v in sorted(params.items())
+        if v is not None and v != "" and k not in VNPAY_HASH_FIELDS
+    )
@@ -0,0 +1,96 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Settings bắt buộc của config.py; test không đọc file .env thật
+os.environ.setdefault("NEXTCLOUD_URL", "http://127.0.0.1:9")
+os.environ.setdefault("NC_USERNAME", "admin")
+os.environ.setdefault("NC_PASSWORD", "admin-password")
+os.environ.setdefault("CACHE_URL", "memory://")
+
+
+class FakeNextcloud:
+    """
+    HTTP server local ghi lại request thô (method, path trên dây, header, body).
+    Request bị client cắt giữa body được ghi vào aborted (method, path).
+    responder(method, path, headers, body) -> (status, headers, body)
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.aborted = []
+        self.responder = lambda method, path, headers, body: (201, {}, b"")
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _handle(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    if self.headers.get("Transfer-Encoding") == "chunked":
+                        body = b""
+                        while True:
+                            size = int(self.rfile.readline().strip(), 16)
+                            if size == 0:
+                                self.rfile.readline()
+                                break
+                            body += self.rfile.read(size)
+                            self.rfile.readline()
+                    else:
+                        body = self.rfile.read(length) if length else b""
+                except (ValueError, OSError):
+                    fake.aborted.append((self.command, self.path))
+                    self.close_connection = True
+                    return
+                fake.requests.append((self.command, self.path, dict(self.headers), body))
+                status, headers, out = fake.responder(self.command, self.path, self.headers, body)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            do_GET = do_PUT = do_POST = do_DELETE = do_MOVE = do_COPY = do_PROPFIND = do_MKCOL = _handle
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def nextcloud(monkeypatch):
+    from config import settings
+
+    fake = FakeNextcloud()
+    monkeypatch.setattr(settings, "NEXTCLOUD_URL", fake.url)
+    yield fake
+    fake.close()
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+    import app
+    import changefeed
+
+    with TestClient(app.app) as c:
+        yield c
+    # Lifespan kết thúc = worker tắt: mở lại change feed cho các test sau
+    changefeed._closing = False
+    app.app.state.draining = False
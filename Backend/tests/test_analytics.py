@@ -0,0 +1,66 @@
+import pytest
+
+import analytics
+import cache
+from config import settings
+
+
+@pytest.fixture
+def shared_cache(tmp_path, monkeypatch):
+    # L2 SQLite dùng chung như khi chạy nhiều worker
+    monkeypatch.setattr(settings, "CACHE_URL", f"sqlite:///{tmp_path / 'cache.sqlite3'}")
+    monkeypatch.setattr(cache, "_cache", cache._Cache())
+    monkeypatch.setattr(analytics, "_users", {})
+    # Không để thread nền ghi giữa chừng trong test
+    monkeypatch.setattr(analytics, "_write_loop", lambda: None)
+
+
+def new_worker(monkeypatch):
+    """
+    Giả lập worker khác: bộ nhớ trong process trống, chỉ chung L2.
+    """
+    monkeypatch.setattr(cache, "_cache", cache._Cache())
+    monkeypatch.setattr(analytics, "_users", {})
+
+
+def paths(summary):
+    return [item["path"] for item in summary["largest_files"]]
+
+
+def test_record_does_not_write_until_flush(shared_cache):
+    analytics.record_file("alice", "/a.txt", 10, "text/plain")
+    assert cache.get("analytics:alice") is None
+
+    analytics.flush()
+    assert set(cache.get("analytics:alice")["entries"]) == {"/a.txt"}
+
+
+def test_workers_do_not_overwrite_other_users(shared_cache, monkeypatch):
+    analytics.record_file("alice", "/a.txt", 10, "text/plain")
+    analytics.summary("bob")
+
+    new_worker(monkeypatch)
+    analytics.record_file("bob", "/b.txt", 20, "text/plain")
+    analytics.flush()
+
+    new_worker(monkeypatch)
+    analytics.record_file("alice", "/a.txt", 10, "text/plain")
+    analytics.flush()
+
+    new_worker(monkeypatch)
+    assert paths(analytics.summary("alice")) == ["/a.txt"]
+    assert paths(analytics.summary("bob")) == ["/b.txt"]
+
+
+def test_reloads_when_another_worker_saved(shared_cache, monkeypatch):
+    assert analytics.summary("alice")["files"] == 0
+    worker_a = (cache._cache, analytics._users)
+
+    new_worker(monkeypatch)
+    analytics.record_file("alice", "/a.txt", 10, "text/plain")
+    analytics.flush()
+
+    monkeypatch.setattr(cache, "_cache", worker_a[0])
+    monkeypatch.setattr(analytics, "_users", worker_a[1])
+    monkeypatch.setattr(cache, "INVALIDATION_POLL", 0)
+    assert paths(analytics.summary("alice")) == ["/a.txt"]
@@ -0,0 +1,100 @@
+import json
+from urllib.parse import parse_qs
+
+import pytest
+
+from admin import users
+from config import settings
+
+ADMIN_KEY = "admin-key"
+
+
+def ocs(statuscode, message=""):
+    return json.dumps({"ocs": {"meta": {"statuscode": statuscode, "message": message}}}).encode()
+
+
+@pytest.fixture
+def admin(nextcloud, monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_API_KEY", ADMIN_KEY)
+
+    # userid quyết định Nextcloud trả lời thế nào
+    created = {"ok": ocs(100), "exists": ocs(102, "User already exists"), "busy": ocs(103, "Try again")}
+
+    def responder(method, path, headers, body):
+        form = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+        if method == "POST":
+            if form["userid"] == "down":
+                return 500, {}, b"Internal Server Error"
+            return 200, {"Content-Type": "application/json"}, created.get(form["userid"], ocs(100))
+        # PUT quota
+        if path.endswith("/quota-fails"):
+            return 200, {"Content-Type": "application/json"}, ocs(101, "Invalid quota")
+        return 200, {"Content-Type": "application/json"}, ocs(100)
+
+    nextcloud.responder = responder
+    return nextcloud
+
+
+def register(client, rows=None, file=None):
+    data = {"admin_key": ADMIN_KEY}
+    if rows is not None:
+        data["users"] = json.dumps(rows)
+    r = client.post("/admin/bulk-register", data=data, files=file)
+    assert r.status_code == 200
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    return {line["username"]: line for line in lines[:-1]}, lines[-1]
+
+
+def test_parse_csv_and_json():
+    csv_text = "\ufeffusername,password,email,plan\n alice ,pw1,,basic\nbob,pw2,b@example.com,\n"
+    assert users.parse_users(csv_text, "users.csv") == [
+        {"username": "alice", "password": "pw1", "plan": "basic"},
+        {"username": "bob", "password": "pw2", "email": "b@example.com"},
+    ]
+    assert users.parse_users('[{"username": "carol", "password": 123, "quota": null}]') == [
+        {"username": "carol", "password": "123"},
+    ]
+    with pytest.raises(ValueError):
+        users.parse_users('[1, 2]')
+
+
+def test_duplicates_and_rows_without_username(client, admin):
+    results, summary = register(client, [
+        {"username": "ok", "password": "x"},
+        {"username": "ok", "password": "y"},
+        {"password": "x"},
+        {"password": "y"},
+    ])
+
+    assert results["ok"]["status"] == "created"
+    assert summary == {"status": "done", "created": 1, "failed": 3}
+    # Hai dòng thiếu username vẫn được báo lỗi riêng, không làm hỏng cả request
+    posted = [body for method, _, _, body in admin.requests if method == "POST"]
+    assert len(posted) == 1
+
+
+def test_ocs_status_mapping(client, admin):
+    results, summary = register(client, [
+        {"username": name, "password": "pw"} for name in ("ok", "exists", "busy", "down")
+    ])
+
+    assert results["ok"]["status"] == "created"
+    assert (results["exists"]["status"], results["exists"]["retry"]) == ("error", False)
+    assert (results["busy"]["status"], results["busy"]["retry"]) == ("error", True)
+    assert (results["down"]["status"], results["down"]["retry"]) == ("error", True)
+    assert summary == {"status": "done", "created": 1, "failed": 3}
+
+
+def test_quota_failure_is_created_but_retryable(client, admin):
+    csv_text = "username,password,quota\nquota-ok,pw,5GB\nquota-fails,pw,5GB\n"
+    results, _ = register(client, file={"file": ("users.csv", csv_text.encode(), "text/csv")})
+
+    assert results["quota-ok"] == {"username": "quota-ok", "status": "created", "quota": "5GB"}
+    assert results["quota-fails"]["status"] == "created"
+    assert results["quota-fails"]["retry"] is True
+    assert results["quota-fails"]["quota_error"] == "Invalid quota"
+
+
+def test_wrong_admin_key(client, admin):
+    r = client.post("/admin/bulk-register", data={"admin_key": "nope", "users": "[]"})
+    assert r.status_code == 403
@@ -0,0 +1,43 @@
+import pytest
+
+import cache
+from config import settings
+
+
+@pytest.fixture
+def shared(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CACHE_URL", f"sqlite:///{tmp_path / 'cache.sqlite3'}")
+    monkeypatch.setattr(cache, "L1_MAX_BYTES", 1000)
+    monkeypatch.setattr(cache, "L1_MAX_VALUE_BYTES", 300)
+    c = cache._Cache()
+    monkeypatch.setattr(cache, "_cache", c)
+    return c
+
+
+def test_large_values_skip_l1_but_stay_in_l2(shared):
+    cache.set("big", "x" * 500, 60)
+    cache.set("small", "y" * 10, 60)
+
+    assert "big" not in shared._l1
+    assert "small" in shared._l1
+    assert cache.get("big") == "x" * 500
+    assert "big" not in shared._l1
+
+
+def test_l1_stays_within_byte_budget(shared):
+    for i in range(20):
+        cache.set(f"k{i}", "v" * 200, 60)
+
+    assert shared._l1_bytes == sum(len(raw) for raw, _ in shared._l1.values())
+    assert shared._l1_bytes <= 1000
+    # Key cũ bị đẩy khỏi L1 vẫn đọc được từ L2
+    assert cache.get("k0") == "v" * 200
+
+
+def test_overwrite_and_delete_release_bytes(shared):
+    cache.set("k", "a" * 200, 60)
+    cache.set("k", "b" * 100, 60)
+    assert shared._l1_bytes == len('"' + "b" * 100 + '"')
+
+    cache.delete("k")
+    assert shared._l1_bytes == 0
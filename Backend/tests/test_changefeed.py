@@ -0,0 +1,85 @@
+import asyncio
+
+import changefeed
+
+
+def test_subscribe_recreates_watch_removed_during_probe(monkeypatch):
+    entries = {"/a.txt": {"path": "/a.txt", "size": 1, "last_modified": None, "type": "text/plain", "etag": "1"}}
+    monkeypatch.setattr(changefeed, "_list", lambda username, folder, auth: (207, "root1", dict(entries)))
+
+    async def scenario():
+        first, _ = await changefeed.subscribe("alice", "pw", "/")
+
+        def probe(username, auth, folder):
+            # Subscriber cuối rời đi trong lúc client mới đang được xác thực
+            changefeed.unsubscribe("alice", "/", first)
+            return 207, "root1"
+
+        monkeypatch.setattr(changefeed, "probe_etag", probe)
+        second, snapshot = await changefeed.subscribe("alice", "pw", "/")
+
+        watch = changefeed._watches.get(("alice", "/"))
+        assert watch is not None
+        assert second in watch.subscribers
+        assert snapshot["entries"] == list(entries.values())
+
+        changefeed.unsubscribe("alice", "/", second)
+        assert not changefeed._watches
+
+    asyncio.run(scenario())
+
+
+def test_changes_requires_authorization_header(client):
+    r = client.get("/changes", params={"username": "alice", "password": "pw"})
+    assert r.status_code == 401
+
+
+def test_close_all_ends_streams_and_rejects_new_subscribers(monkeypatch):
+    monkeypatch.setattr(changefeed, "_list", lambda username, folder, auth: (207, "root1", {}))
+    monkeypatch.setattr(changefeed, "_closing", False)
+
+    async def scenario():
+        q, snapshot = await changefeed.subscribe("alice", "pw", "/")
+        events = changefeed.stream("alice", "/", q, snapshot)
+        assert (await events.__anext__()).startswith("event: snapshot")
+
+        changefeed.close_all()
+
+        assert (await events.__anext__()).startswith("event: shutdown")
+        try:
+            await events.__anext__()
+            assert False, "stream should end after shutdown"
+        except StopAsyncIteration:
+            pass
+        assert not changefeed._watches
+        assert await changefeed.subscribe("alice", "pw", "/") == (None, 503)
+
+    asyncio.run(scenario())
+
+
+def test_forget_user_ends_streams_and_drops_old_password(monkeypatch):
+    monkeypatch.setattr(changefeed, "_list", lambda username, folder, auth: (207, "root1", {}))
+    monkeypatch.setattr(changefeed, "_closing", False)
+
+    async def scenario():
+        alice, snapshot = await changefeed.subscribe("alice", "old-pw", "/")
+        bob, _ = await changefeed.subscribe("bob", "pw", "/")
+        watch = changefeed._watches[("alice", "/")]
+        events = changefeed.stream("alice", "/", alice, snapshot)
+        assert (await events.__anext__()).startswith("event: snapshot")
+
+        # Endpoint đổi mật khẩu là hàm sync, chạy trong threadpool
+        await asyncio.to_thread(changefeed.forget_user, "alice")
+
+        assert (await events.__anext__()).startswith("event: error")
+        try:
+            await events.__anext__()
+            assert False, "stream should end after the password change"
+        except StopAsyncIteration:
+            pass
+        assert watch.auth is None
+        assert list(changefeed._watches) == [("bob", "/")]
+
+        changefeed.unsubscribe("bob", "/", bob)
+
+    asyncio.run(scenario())
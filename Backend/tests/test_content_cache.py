@@ -0,0 +1,86 @@
+import asyncio
+import os
+
+import pytest
+
+import content_cache
+from config import settings
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CONTENT_CACHE_DIR", str(tmp_path))
+    content_cache._index.clear()
+    yield tmp_path
+    content_cache._index.clear()
+
+
+def body(response) -> bytes:
+    async def read():
+        return b"".join([chunk async for chunk in response.body_iterator])
+    return asyncio.run(read())
+
+
+def test_concurrent_stores_of_same_path_both_complete(cache_dir):
+    first = content_cache._store("alice", "/hot.bin", '"e1"', "application/octet-stream", iter([b"aa", b"bb"]))
+    second = content_cache._store("alice", "/hot.bin", '"e1"', "application/octet-stream", iter([b"aa", b"bb"]))
+
+    # Xen kẽ hai lượt tải của cùng một file trong cùng worker
+    out_first, out_second = [], []
+    for a, b in zip(first, second):
+        out_first.append(a)
+        out_second.append(b)
+    out_first.extend(first)
+    out_second.extend(second)
+
+    assert b"".join(out_first) == b"aabb"
+    assert b"".join(out_second) == b"aabb"
+    cached = content_cache.lookup("alice", "/hot.bin")
+    assert cached is not None and cached["size"] == 4
+    assert not [name for name in os.listdir(cache_dir) if name.endswith(".tmp")]
+
+
+def test_lookup_misses_when_file_deleted_by_another_worker(cache_dir):
+    list(content_cache._store("alice", "/a.txt", '"e1"', "text/plain", iter([b"hello"])))
+    assert content_cache.lookup("alice", "/a.txt") is not None
+
+    for name in os.listdir(cache_dir):
+        os.unlink(cache_dir / name)
+
+    assert content_cache.lookup("alice", "/a.txt") is None
+
+
+def test_download_falls_back_to_get_when_cached_file_vanishes(cache_dir, nextcloud):
+    calls = []
+
+    def responder(method, path, headers, body):
+        calls.append(headers.get("If-None-Match"))
+        if headers.get("If-None-Match") == '"e1"':
+            # Worker khác xóa file cache ngay trước khi Nextcloud trả 304
+            for name in os.listdir(cache_dir):
+                os.unlink(cache_dir / name)
+            return 304, {"ETag": '"e1"'}, b""
+        return 200, {"ETag": '"e1"'}, b"hello"
+
+    nextcloud.responder = responder
+    url = f"{nextcloud.url}/a.txt"
+
+    first = content_cache.download("alice", "/a.txt", url, ("alice", "pw"), "a.txt")
+    assert body(first) == b"hello"
+
+    second = content_cache.download("alice", "/a.txt", url, ("alice", "pw"), "a.txt")
+    assert body(second) == b"hello"
+    assert calls == [None, '"e1"', None]
+
+
+def test_size_cap_is_computed_from_disk(cache_dir, monkeypatch):
+    monkeypatch.setattr(settings, "CONTENT_CACHE_MAX_BYTES", 10)
+    list(content_cache._store("alice", "/old.bin", '"e1"', None, iter([b"x" * 6])))
+    os.utime(cache_dir / content_cache._key("alice", "/old.bin"), (1, 1))
+
+    # Một worker khác (index trống) ghi thêm: vẫn phải evict file cũ
+    content_cache._index.clear()
+    list(content_cache._store("alice", "/new.bin", '"e2"', None, iter([b"y" * 6])))
+
+    assert content_cache.lookup("alice", "/old.bin") is None
+    assert content_cache.lookup("alice", "/new.bin") is not None
@@ -0,0 +1,4 @@
+def test_etag_is_exposed_to_browsers(client):
+    r = client.get("/ready", headers={"Origin": "https://example.com"})
+    exposed = [h.strip().lower() for h in r.headers["access-control-expose-headers"].split(",")]
+    assert "etag" in exposed
@@ -0,0 +1,72 @@
+import sys
+import threading
+import time
+
+import pytest
+
+import ids
+from config import settings
+
+
+@pytest.mark.parametrize("host", [None, 32, -1])
+def test_require_host_id_rejects_default_and_out_of_range(monkeypatch, host):
+    monkeypatch.setattr(settings, "ID_HOST_ID", host)
+    with pytest.raises(RuntimeError):
+        ids.require_host_id()
+
+
+def test_host_id_goes_into_every_id(monkeypatch):
+    monkeypatch.setattr(settings, "ID_HOST_ID", 7)
+    monkeypatch.setattr(ids, "_worker_id", None)
+    # Nhận slot mới trong test: đóng lại sau đó để không giữ lock của slot thứ hai
+    monkeypatch.setattr(ids, "_slot_file", None)
+
+    try:
+        assert ids.require_host_id() == 7
+        assert (ids.next_id() >> ids.WORKER_BITS) & ((1 << ids.HOST_BITS) - 1) == 7
+    finally:
+        if ids._slot_file is not None:
+            ids._slot_file.close()
+
+
+@pytest.fixture
+def fixed_worker(monkeypatch):
+    # Worker cố định: test không cần nhận slot (file lock)
+    monkeypatch.setattr(ids, "_worker_id", 5)
+
+
+def test_ids_unique_and_increasing_across_threads(fixed_worker):
+    per_thread = 20000
+    results = []
+
+    def generate():
+        batch = [ids.next_id() for _ in range(per_thread)]
+        results.append(batch)
+
+    # Đổi thread thường xuyên để các thread chen nhau cả lúc reseed bộ đếm
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=generate) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert len({value for batch in results for value in batch}) == 8 * per_thread
+    for batch in results:
+        assert all(a < b for a, b in zip(batch, batch[1:]))
+        assert all(value & ((1 << ids.WORKER_BITS) - 1) == 5 for value in batch)
+
+
+def test_next_id_throughput(fixed_worker):
+    count = 100000
+    started = time.perf_counter()
+    for _ in range(count):
+        ids.next_id()
+    elapsed = time.perf_counter() - started
+
+    # Ngưỡng thấp để không chập chờn trên CI; đường chính không lock nên thực tế nhanh hơn nhiều
+    assert count / elapsed > 50000
@@ -0,0 +1,71 @@
+import pytest
+
+import accounts
+import cache
+import listings
+
+
+def row(name, size):
+    return {
+        "path": f"/remote.php/dav/files/alice/{name}", "name": name, "size": size,
+        "last_modified": None, "type": "text/plain", "folder": False,
+        "sort_name": name, "mtime": 0.0,
+    }
+
+
+@pytest.fixture
+def folder(monkeypatch):
+    state = {"etag": "e1", "fetches": 0}
+
+    def fetch_base(username, auth, folder):
+        state["fetches"] += 1
+        return {"etag": state["etag"], "rows": [row(f"{i}.txt", i) for i in range(10)]}
+
+    monkeypatch.setattr(listings, "_fetch_base", fetch_base)
+    monkeypatch.setattr(listings, "probe_etag", lambda username, auth, folder: (207, state["etag"]))
+    monkeypatch.setattr(accounts, "check_credentials", lambda username, password: True)
+    monkeypatch.setattr(listings, "_local_views", listings.OrderedDict())
+    return state
+
+
+def view_reads(monkeypatch):
+    reads = []
+    get = cache.get
+
+    def counting_get(key):
+        if key.startswith("listing-view:"):
+            reads.append(key)
+        return get(key)
+
+    monkeypatch.setattr(cache, "get", counting_get)
+    return reads
+
+
+def test_cursor_pages_reuse_decoded_view(folder, monkeypatch):
+    sort = listings.parse_sort("name")
+    view, _ = listings.get_view("alice", "pw", "/", sort, [])
+    vid = listings.view_id("/", sort, [])
+    reads = view_reads(monkeypatch)
+
+    for offset in (3, 6, 9):
+        cursor = listings.encode_cursor("e1", offset, vid)
+        page_view, page_offset = listings.get_view("alice", "pw", "/", sort, [], cursor)
+        assert page_view is view
+        assert page_offset == offset
+
+    assert reads == []
+    assert folder["fetches"] == 1
+
+
+def test_folder_change_is_not_served_from_local_view(folder):
+    sort = listings.parse_sort("name")
+    vid = listings.view_id("/", sort, [])
+    listings.get_view("alice", "pw", "/", sort, [])
+
+    folder["etag"] = "e2"
+    view, _ = listings.get_view("alice", "pw", "/", sort, [])
+    assert view["etag"] == "e2"
+
+    with pytest.raises(listings.ListingError) as e:
+        listings.get_view("alice", "pw", "/", sort, [], listings.encode_cursor("e1", 3, vid))
+    assert e.value.status_code == 410
@@ -0,0 +1,20 @@
+from urllib.parse import unquote
+
+import pytest
+
+
+@pytest.mark.parametrize("method", ["move", "copy"])
+def test_source_and_destination_are_percent_encoded(nextcloud, client, method):
+    r = client.post(f"/{method}", data={
+        "username": "alice",
+        "password": "pw",
+        "source": "/a b#1%?.txt",
+        "destination": "/dir/c d#2%?.txt",
+    })
+
+    assert r.status_code == 200
+    sent_method, path, headers, _ = nextcloud.requests[-1]
+    assert sent_method == method.upper()
+    assert path == "/remote.php/dav/files/alice/a%20b%231%25%3F.txt"
+    assert unquote(path) == "/remote.php/dav/files/alice/a b#1%?.txt"
+    assert headers["Destination"] == f"{nextcloud.url}/remote.php/dav/files/alice/dir/c%20d%232%25%3F.txt"
@@ -0,0 +1,157 @@
+import hashlib
+import hmac
+import json
+import sys
+from urllib.parse import quote_plus
+
+import pytest
+
+import app
+import payment_providers
+
+KEY2 = "zalopay-key2"
+VNPAY_SECRET = "vnpay-secret"
+MOMO_ACCESS_KEY = "momo-access"
+MOMO_SECRET = "momo-secret"
+
+
+@pytest.fixture(autouse=True)
+def payments(tmp_path, monkeypatch):
+    for name, value in {
+        "ZALOPAY_APP_ID": "1", "ZALOPAY_KEY1": "zalopay-key1", "ZALOPAY_KEY2": KEY2,
+        "ZALOPAY_CREATE_ORDER_URL": "http://127.0.0.1:9/create", "ZALOPAY_RETURN_URL": "http://127.0.0.1:9/",
+        "ZALOPAY_CALLBACK_URL": "http://127.0.0.1:9/callback",
+        "VNPAY_TMNCODE": "TMN", "VNPAY_HASH_SECRET_KEY": VNPAY_SECRET,
+        "VNPAY_PAYMENT_URL": "http://127.0.0.1:9/pay", "VNPAY_RETURN_URL": "http://127.0.0.1:9/",
+        "PARTNER_CODE": "MOMO", "MOMO_ACCESS_KEY": MOMO_ACCESS_KEY, "MOMO_SECRET_KEY": MOMO_SECRET,
+        "ENDPOINT": "http://127.0.0.1:9/momo", "MOMO_RETURN_URL": "http://127.0.0.1:9/",
+    }.items():
+        monkeypatch.setenv(name, value)
+    for module in ("zalopay", "vnpay", "momo"):
+        monkeypatch.delitem(sys.modules, module, raising=False)
+    monkeypatch.setattr(payment_providers, "_loaded", {})
+
+    monkeypatch.setattr(app, "Payment_file", str(tmp_path / "payments.json"))
+    upgrades = []
+    monkeypatch.setattr(app, "update_nextcloud_quota", lambda username, plan_name: upgrades.append((username, plan_name)))
+    app.create_pending_payment("260101_1", "alice", "basic", 50000)
+    app.create_pending_payment("V1", "bob", "basic", 50000, provider="vnpay")
+    app.create_pending_payment("MOMO1", "carol", "basic", 50000, provider="momo")
+    return upgrades
+
+
+def zalopay_body(order, key=KEY2):
+    data = json.dumps(order)
+    mac = hmac.new(key.encode(), data.encode(), hashlib.sha256).hexdigest()
+    return {"data": data, "mac": mac, "type": 1}
+
+
+def test_zalopay_callback_marks_paid_with_valid_mac(client, payments):
+    r = client.post("/payment/zalopay/callback", json=zalopay_body({"app_trans_id": "260101_1", "amount": 50000}))
+
+    assert r.json()["return_code"] == 1
+    assert app.load_payments()["260101_1"]["status"] == "PAID"
+    assert payments == [("alice", "basic")]
+
+
+@pytest.mark.parametrize("body", [
+    zalopay_body({"app_trans_id": "260101_1", "amount": 50000}, key="wrong-key"),
+    {**zalopay_body({"app_trans_id": "260101_1", "amount": 50000}), "data": '{"app_trans_id": "260101_1", "amount": 1}'},
+    {"app_trans_id": "260101_1", "status": 1},
+])
+def test_zalopay_callback_rejects_unsigned(client, payments, body):
+    r = client.post("/payment/zalopay/callback", json=body)
+
+    assert r.json()["return_code"] == -1
+    assert app.load_payments()["260101_1"]["status"] == "PENDING"
+    assert payments == []
+
+
+def test_zalopay_callback_checks_amount(client, payments):
+    r = client.post("/payment/zalopay/callback", json=zalopay_body({"app_trans_id": "260101_1", "amount": 1}))
+
+    assert r.json()["return_code"] == 0
+    assert payments == []
+
+
+def vnpay_query(params, secret=VNPAY_SECRET):
+    canonical = "&".join(f"{k}={quote_plus(str(v))}" for k, v in sorted(params.items()))
+    secure_hash = hmac.new(secret.encode(), canonical.encode(), hashlib.sha512).hexdigest()
+    return {**params, "vnp_SecureHash": secure_hash}
+
+
+VNPAY_OK = {
+    "vnp_TxnRef": "V1", "vnp_Amount": "5000000", "vnp_ResponseCode": "00",
+    "vnp_TransactionStatus": "00", "vnp_OrderInfo": "Thanh toan goi basic",
+}
+
+
+def test_vnpay_ipn_marks_paid_once(client, payments):
+    r = client.get("/payment/vnpay/ipn", params=vnpay_query(VNPAY_OK))
+    assert r.json()["RspCode"] == "00"
+    r = client.get("/payment/vnpay/ipn", params=vnpay_query(VNPAY_OK))
+    assert r.json()["RspCode"] == "02"
+    assert payments == [("bob", "basic")]
+
+
+def test_vnpay_ipn_rejects_bad_signature(client, payments):
+    r = client.get("/payment/vnpay/ipn", params=vnpay_query(VNPAY_OK, secret="wrong"))
+
+    assert r.json()["RspCode"] == "97"
+    assert app.load_payments()["V1"]["status"] == "PENDING"
+    assert payments == []
+
+
+def momo_ipn(**overrides):
+    # Dạng IPN thật của MoMo: không có accessKey trong body
+    ipn = {
+        "partnerCode": "MOMO", "orderId": "MOMO1", "requestId": "MOMO1", "amount": 50000,
+        "orderInfo": "Thanh toan goi basic", "orderType": "momo_wallet", "transId": 4088878653,
+        "resultCode": 0, "message": "Thành công.", "payType": "qr", "responseTime": 1721720663942,
+        "extraData": "", **overrides,
+    }
+    raw = (
+        f"accessKey={MOMO_ACCESS_KEY}&amount={ipn['amount']}&extraData={ipn['extraData']}"
+        f"&message={ipn['message']}&orderId={ipn['orderId']}&orderInfo={ipn['orderInfo']}"
+        f"&orderType={ipn['orderType']}&partnerCode={ipn['partnerCode']}&payType={ipn['payType']}"
+        f"&requestId={ipn['requestId']}&responseTime={ipn['responseTime']}"
+        f"&resultCode={ipn['resultCode']}&transId={ipn['transId']}"
+    )
+    ipn["signature"] = hmac.new(MOMO_SECRET.encode(), raw.encode(), hashlib.sha256).hexdigest()
+    return ipn
+
+
+def test_momo_ipn_marks_paid(client, payments):
+    r = client.post("/payment/notify", json=momo_ipn())
+
+    assert r.json() == {"status": "ok"}
+    assert app.load_payments()["MOMO1"]["status"] == "PAID"
+    assert payments == [("carol", "basic")]
+
+
+@pytest.mark.parametrize("body", [
+    {**momo_ipn(), "amount": 1},
+    {**momo_ipn(), "signature": "0" * 64},
+])
+def test_momo_ipn_rejects_bad_signature(client, payments, body):
+    r = client.post("/payment/notify", json=body)
+
+    assert r.json() == {"status": "invalid signature"}
+    assert app.load_payments()["MOMO1"]["status"] == "PENDING"
+    assert payments == []
+
+
+def test_momo_ipn_failed_payment_upgrades_nothing(client, payments):
+    r = client.post("/payment/notify", json=momo_ipn(resultCode=1006, message="Giao dich bi tu choi"))
+
+    assert r.json() == {"status": "ok"}
+    assert app.load_payments()["MOMO1"]["status"] == "PENDING"
+    assert payments == []
+
+
+@pytest.mark.parametrize("body", [b"[1, 2]", b'"text"', b"not json"])
+def test_momo_ipn_rejects_non_object_body(client, payments, body):
+    r = client.post("/payment/notify", content=body, headers={"Content-Type": "application/json"})
+
+    assert r.status_code == 400
+    assert payments == []
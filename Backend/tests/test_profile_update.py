@@ -0,0 +1,152 @@
+import base64
+import json
+import threading
+import time
+from urllib.parse import parse_qs
+
+import pytest
+
+import accounts
+import changefeed
+from auth import user
+from sharing import share
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+    monkeypatch.setattr(user, "put_user_field", lambda username, auth, key, value: {"status": "updated"})
+    monkeypatch.setattr(accounts, "update_cached", lambda *args: None)
+    monkeypatch.setattr(share, "invalidate_shares", lambda username: calls.append(("shares", username)))
+    monkeypatch.setattr(changefeed, "forget_user", lambda username: calls.append(("changefeed", username)))
+    return calls
+
+
+def test_password_change_drops_state_tied_to_old_password(client, calls):
+    r = client.post("/auth/me/update", data={"username": "alice", "password": "old", "new_password": "new"})
+
+    assert r.status_code == 200
+    assert calls == [("shares", "alice"), ("changefeed", "alice")]
+
+
+def test_profile_change_keeps_shares_and_streams(client, calls):
+    r = client.post("/auth/me/update", data={"username": "alice", "password": "old", "email": "a@example.com"})
+
+    assert r.status_code == 200
+    assert calls == []
+
+
+PUT_DELAY = 0.3
+
+
+@pytest.fixture
+def profile(nextcloud):
+    """
+    Nextcloud giả giữ record của alice: GET /cloud/user trả record nếu đúng mật khẩu,
+    PUT /cloud/users/alice đổi field. Field trong fail_keys trả lỗi OCS 102.
+    """
+    state = {
+        "password": "old", "display-name": "Alice", "email": "alice@example.com",
+        "timings": [], "fail_keys": set(),
+    }
+    lock = threading.Lock()
+
+    def ocs(statuscode, data=None, message=""):
+        body = {"ocs": {"meta": {"statuscode": statuscode, "message": message}, "data": data or {}}}
+        return 200, {"Content-Type": "application/json"}, json.dumps(body).encode()
+
+    def responder(method, path, headers, body):
+        password = base64.b64decode(headers["Authorization"].split()[1]).decode().split(":", 1)[1]
+        if password != state["password"]:
+            return 401, {}, b""
+        if method == "GET" and path == "/ocs/v1.php/cloud/user":
+            return ocs(100, {
+                "id": "alice", "display-name": state["display-name"], "email": state["email"],
+                "quota": {"free": 900, "used": 100, "quota": 1000, "relative": 10},
+            })
+
+        form = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+        started = time.monotonic()
+        if form["key"] != "password":
+            time.sleep(PUT_DELAY)
+        with lock:
+            state["timings"].append((form["key"], started, time.monotonic()))
+        if form["key"] in state["fail_keys"]:
+            return ocs(102, message=f"Invalid {form['key']}")
+        state["display-name" if form["key"] == "displayname" else form["key"]] = form["value"]
+        return ocs(100)
+
+    accounts.invalidate("alice")
+    nextcloud.responder = responder
+    nextcloud.state = state
+    yield nextcloud
+    accounts.invalidate("alice")
+
+
+def me(client, password):
+    return client.post("/auth/me", data={"username": "alice", "password": password})
+
+
+def test_fields_run_concurrently_and_password_last(client, profile):
+    r = client.post("/auth/me/update", data={
+        "username": "alice", "password": "old",
+        "displayname": "Alice B", "email": "b@example.com", "new_password": "new",
+    })
+
+    assert r.status_code == 200
+    assert r.json()["results"] == {
+        "displayname": {"status": "updated"},
+        "email": {"status": "updated"},
+        "password": {"status": "updated"},
+    }
+    timings = {key: (started, ended) for key, started, ended in profile.state["timings"]}
+    assert list(timings)[-1] == "password"
+    # Hai PUT chồng lên nhau: PUT sau bắt đầu trước khi PUT kia xong
+    assert max(timings["displayname"][0], timings["email"][0]) < min(timings["displayname"][1], timings["email"][1])
+    assert timings["password"][0] >= max(timings["displayname"][1], timings["email"][1])
+
+
+def test_partial_failure_returns_400_with_results(client, profile):
+    profile.state["fail_keys"].add("email")
+
+    r = client.post("/auth/me/update", data={
+        "username": "alice", "password": "old", "displayname": "Alice B", "email": "not-an-email",
+    })
+
+    assert r.status_code == 400
+    assert r.json()["results"] == {
+        "displayname": {"status": "updated"},
+        "email": {"status": "error", "detail": "Invalid email"},
+    }
+    # Record trong cache bị bỏ: /auth/me lấy lại từ Nextcloud
+    count = len(profile.requests)
+    assert me(client, "old").json()["display_name"] == "Alice B"
+    assert len(profile.requests) == count + 1
+
+
+def test_cached_record_updated_in_place(client, profile):
+    assert me(client, "old").json()["display_name"] == "Alice"
+
+    r = client.post("/auth/me/update", data={
+        "username": "alice", "password": "old", "displayname": "Alice B", "email": "b@example.com",
+    })
+    assert r.status_code == 200
+
+    count = len(profile.requests)
+    data = me(client, "old").json()
+    assert (data["display_name"], data["email"]) == ("Alice B", "b@example.com")
+    assert len(profile.requests) == count
+
+
+def test_password_change_moves_cached_record_to_new_password(client, profile):
+    me(client, "old")
+
+    r = client.post("/auth/me/update", data={"username": "alice", "password": "old", "new_password": "new"})
+    assert r.status_code == 200
+
+    count = len(profile.requests)
+    assert me(client, "new").status_code == 200
+    assert len(profile.requests) == count
+    # Mật khẩu cũ không khớp record trong cache: hỏi lại Nextcloud và bị từ chối
+    assert me(client, "old").status_code == 401
+    assert len(profile.requests) == count + 1
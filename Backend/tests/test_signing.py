@@ -0,0 +1,117 @@
+import hashlib
+import hmac
+from urllib.parse import quote_plus
+
+from signing import (
+    get_signer, momo_canonical, zalopay_canonical, vnpay_canonical,
+    MOMO_CREATE_FIELDS, MOMO_IPN_FIELDS, ZALOPAY_CREATE_FIELDS,
+)
+
+SECRET = "K951B6PE1waDMi640xX08PD3vg6EkVlz"
+ACCESS_KEY = "F8BBA842ECF85"
+
+MOMO_ORDER = {
+    "partnerCode": "MOMO", "accessKey": "F8BBA842ECF85", "requestId": "MOMO123",
+    "amount": "50000", "orderId": "MOMO123", "orderInfo": "Thanh toan goi basic cho nguoi dung alice",
+    "redirectUrl": "https://example.com/return", "ipnUrl": "https://example.com/return",
+    "extraData": "", "requestType": "captureWallet", "lang": "vi",
+}
+MOMO_IPN = {
+    "partnerCode": "MOMO", "orderId": "MOMO123", "requestId": "MOMO123",
+    "amount": 50000, "orderInfo": "Thanh toan goi basic", "orderType": "momo_wallet",
+    "transId": 4088878653, "resultCode": 0, "message": "Thành công.", "payType": "qr",
+    "responseTime": 1721720663942, "extraData": "",
+}
+ZALOPAY_ORDER = {
+    "app_id": 2553, "app_trans_id": "260101_123", "app_user": "alice", "amount": 50000,
+    "app_time": 1767225600000, "embed_data": '{"redirecturl": "https://example.com/"}',
+    "item": '[{"plan": "basic"}]', "description": "Nang cap goi basic",
+}
+VNPAY_PARAMS = {
+    "vnp_Version": "2.1.0", "vnp_Command": "pay", "vnp_TmnCode": "TMN01", "vnp_Amount": 5000000,
+    "vnp_CurrCode": "VND", "vnp_TxnRef": "123", "vnp_OrderInfo": "Thanh toan goi basic & pro",
+    "vnp_OrderType": "other", "vnp_Locale": "vn", "vnp_ReturnUrl": "https://example.com/return?a=1",
+    "vnp_IpAddr": "127.0.0.1", "vnp_CreateDate": "20260101000000", "vnp_BankCode": "",
+    "vnp_SecureHashType": "HmacSHA512",
+}
+
+# Chữ ký của các mẫu trên theo bản gốc
+MOMO_SIGNATURE = "e5f3bec94da6bce19e53f66692fc8d564ca9e9986f85773cfcf2434d71af49e8"
+ZALOPAY_MAC = "20deb75851b4f93bf901513115839093b78461220d4e049f3ef82476cd5821fc"
+VNPAY_HASH = (
+    "f2e211723e026b33ee3333b4b6b7e771d28a69abcc13ba2aeb0635d11339e5f8"
+    "bc44880aa615f12f6dc4188ce1a6bc2d371508dd961b3736ce523c3ecdfbff6a"
+)
+
+
+# Cách ký của bản gốc (trước khi gom về signing.py), viết lại để đối chiếu
+def baseline_momo_create(d):
+    raw = (
+        f"accessKey={d['accessKey']}&amount={d['amount']}&extraData={d['extraData']}"
+        f"&ipnUrl={d['ipnUrl']}&orderId={d['orderId']}&orderInfo={d['orderInfo']}"
+        f"&partnerCode={d['partnerCode']}&redirectUrl={d['redirectUrl']}"
+        f"&requestId={d['requestId']}&requestType={d['requestType']}"
+    )
+    return hmac.new(SECRET.encode(), raw.encode(), hashlib.sha256).hexdigest()
+
+
+def baseline_momo_ipn(d):
+    raw = (
+        f"accessKey={d['accessKey']}&amount={d['amount']}&extraData={d['extraData']}"
+        f"&message={d['message']}&orderId={d['orderId']}&orderInfo={d['orderInfo']}"
+        f"&orderType={d['orderType']}&partnerCode={d['partnerCode']}&payType={d['payType']}"
+        f"&requestId={d['requestId']}&responseTime={d['responseTime']}"
+        f"&resultCode={d['resultCode']}&transId={d['transId']}"
+    )
+    return hmac.new(SECRET.encode(), raw.encode(), hashlib.sha256).hexdigest()
+
+
+def baseline_zalopay(order):
+    data = "|".join([
+        str(order["app_id"]), order["app_trans_id"], order["app_user"], str(order["amount"]),
+        str(order["app_time"]), order["embed_data"], order["item"],
+    ])
+    return hmac.new(SECRET.encode("utf-8"), data.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def baseline_vnpay(params):
+    query_string = "&".join(
+        f"{k}={quote_plus(str(v))}"
+        for k, v in sorted(params.items())
+        if v is not None and v != "" and k not in ["vnp_SecureHash", "vnp_SecureHashType"]
+    )
+    return hmac.new(SECRET.encode(), query_string.encode(), hashlib.sha512).hexdigest()
+
+
+def test_momo_matches_baseline():
+    signer = get_signer(SECRET, "sha256")
+    assert signer.sign(momo_canonical(MOMO_ORDER, MOMO_CREATE_FIELDS)) == baseline_momo_create(MOMO_ORDER)
+    # IPN không có accessKey: được điền bằng accessKey của merchant trước khi ký
+    ipn = {**MOMO_IPN, "accessKey": ACCESS_KEY}
+    assert signer.sign(momo_canonical(ipn, MOMO_IPN_FIELDS)) == baseline_momo_ipn(ipn)
+
+
+def test_zalopay_matches_baseline():
+    signer = get_signer(SECRET, "sha256")
+    assert signer.sign(zalopay_canonical(ZALOPAY_ORDER, ZALOPAY_CREATE_FIELDS)) == baseline_zalopay(ZALOPAY_ORDER)
+
+
+def test_vnpay_matches_baseline():
+    signer = get_signer(SECRET, "sha512")
+    assert signer.sign(vnpay_canonical(VNPAY_PARAMS)) == baseline_vnpay(VNPAY_PARAMS)
+
+
+def test_known_answers():
+    # Giá trị cố định: đổi cách ký (kể cả ở bản gốc trong test) sẽ làm test này hỏng
+    assert get_signer(SECRET, "sha256").sign(momo_canonical(MOMO_ORDER)) == MOMO_SIGNATURE
+    assert get_signer(SECRET, "sha256").sign(zalopay_canonical(ZALOPAY_ORDER)) == ZALOPAY_MAC
+    assert get_signer(SECRET, "sha512").sign(vnpay_canonical(VNPAY_PARAMS)) == VNPAY_HASH
+
+
+def test_verify_accepts_own_signature_only():
+    signer = get_signer(SECRET, "sha512")
+    signature = signer.sign(vnpay_canonical(VNPAY_PARAMS))
+    assert signer.verify(vnpay_canonical(VNPAY_PARAMS), signature)
+    assert signer.verify(vnpay_canonical(VNPAY_PARAMS), signature.upper())
+    assert not signer.verify(vnpay_canonical({**VNPAY_PARAMS, "vnp_Amount": 1}), signature)
+    assert not signer.verify(vnpay_canonical(VNPAY_PARAMS), None)
@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+import pytest
+
+import quota
+from uploads import MultipartStream, UploadError
+
+BOUNDARY = "test-boundary"
+CONTENT = b"hello nextcloud " * 64
+
+
+def field(name, value):
+    return f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+
+
+def file_part(data, filename="a.txt"):
+    return (
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f"Content-Type: text/plain\r\n\r\n"
+    ).encode() + data + b"\r\n"
+
+
+END = f"--{BOUNDARY}--\r\n".encode()
+FIELDS_FIRST = field("username", "alice") + field("password", "secret") + file_part(CONTENT) + END
+FILE_FIRST = file_part(CONTENT) + field("username", "alice") + field("password", "secret") + END
+
+
+def chunked(body, size=7):
+    # Chunk nhỏ để boundary và header bị cắt ngang giữa các lần đọc
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+class FakeRequest:
+    def __init__(self, body):
+        self.headers = {
+            "content-type": f"multipart/form-data; boundary={BOUNDARY}",
+            "content-length": str(len(body)),
+        }
+        self._chunks = chunked(body)
+
+    async def stream(self):
+        for chunk in self._chunks:
+            yield chunk
+
+
+def read_parts(body):
+    async def scenario():
+        parts = []
+        async for part in MultipartStream(FakeRequest(body)).parts():
+            parts.append((part.name, part.filename, await part.read(len(CONTENT) + 1)))
+        return parts
+
+    return asyncio.run(scenario())
+
+
+def test_multipart_fields_first():
+    assert read_parts(FIELDS_FIRST) == [
+        ("username", None, b"alice"), ("password", None, b"secret"), ("file", "a.txt", CONTENT),
+    ]
+
+
+def test_multipart_file_first():
+    assert read_parts(FILE_FIRST) == [
+        ("file", "a.txt", CONTENT), ("username", None, b"alice"), ("password", None, b"secret"),
+    ]
+
+
+@pytest.mark.parametrize("cut", [len(FIELDS_FIRST) - len(END), len(FIELDS_FIRST) - len(END) - 100, 30])
+def test_multipart_truncated_body(cut):
+    with pytest.raises(UploadError) as e:
+        read_parts(FIELDS_FIRST[:cut])
+    assert e.value.status_code == 400
+
+
+def post(client, body):
+    return client.post(
+        "/upload",
+        content=iter(chunked(body, 256)),
+        headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}", "Content-Length": str(len(body))},
+    )
+
+
+@pytest.mark.parametrize("body", [FIELDS_FIRST, FILE_FIRST], ids=["fields-first", "file-first"])
+def test_upload_either_order(client, nextcloud, monkeypatch, body):
+    monkeypatch.setattr(quota, "check_fits", lambda username, auth, nbytes: (True, None))
+
+    r = post(client, body)
+
+    assert r.status_code == 200
+    assert [(method, path, data) for method, path, _, data in nextcloud.requests] == [
+        ("PUT", "/remote.php/dav/files/alice/a.txt", CONTENT)
+    ]
+
+
+def test_quota_exceeded_aborts_upstream_put(client, nextcloud, monkeypatch):
+    # Quota báo còn 300 byte, lấy lại vẫn vậy: file 1 KB phải bị dừng giữa chừng
+    monkeypatch.setattr(quota, "check_fits", lambda username, auth, nbytes: (True, 300))
+    monkeypatch.setattr(quota, "fetch", lambda username, auth: {"used": 0, "free": 300, "total": 300})
+
+    r = post(client, FIELDS_FIRST)
+
+    assert r.status_code == 507
+    # PUT đã bắt đầu stream rồi bị hủy giữa body: Nextcloud không nhận file nào trọn vẹn
+    deadline = time.monotonic() + 2
+    while not nextcloud.aborted and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert nextcloud.aborted == [("PUT", "/remote.php/dav/files/alice/a.txt")]
+    assert nextcloud.requests == []
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+import quota
+
+BOUNDARY = "test-boundary"
+
+
+def field(name, value):
+    return f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+
+
+def file_part(filename, data):
+    return (
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="files"; filename="{filename}"\r\n'
+        f"Content-Type: text/plain\r\n\r\n"
+    ).encode() + data + b"\r\n"
+
+
+def post(client, body):
+    return client.post(
+        "/upload-many",
+        content=body,
+        headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"},
+    )
+
+
+@pytest.fixture(autouse=True)
+def enough_quota(monkeypatch):
+    monkeypatch.setattr(quota, "check_fits", lambda username, auth, nbytes: (True, None))
+
+
+def test_invalid_path_is_reported_and_others_upload(client, nextcloud):
+    body = (
+        field("username", "alice") + field("password", "secret")
+        + file_part("a.txt", b"aaa")
+        + file_part("../evil.txt", b"evil")
+        + file_part("b.txt", b"bbb")
+        + f"--{BOUNDARY}--\r\n".encode()
+    )
+    r = post(client, body)
+
+    assert r.status_code == 200
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert {line["path"] for line in lines if line["status"] == "success"} == {"/a.txt", "/b.txt"}
+    assert [line["path"] for line in lines if line["status"] == "error"] == ["../evil.txt"]
+    assert lines[-1] == {"status": "done", "uploaded": 2, "failed": 1}
+
+    puts = sorted(path for method, path, _, _ in nextcloud.requests if method == "PUT")
+    assert puts == ["/remote.php/dav/files/alice/a.txt", "/remote.php/dav/files/alice/b.txt"]
+
+
+def test_truncated_body_waits_for_started_uploads(client, nextcloud):
+    body = (
+        field("username", "alice") + field("password", "secret")
+        + file_part("a.txt", b"aaa")
+        + file_part("b.txt", b"bbb")[:-10]
+    )
+    r = post(client, body)
+
+    assert r.status_code == 400
+    # PUT của a.txt (nếu đã chạy) xong trước khi trả lỗi, không chạy tiếp sau đó
+    count = len(nextcloud.requests)
+    r = client.get("/docs")
+    assert len(nextcloud.requests) == count
+    assert all(path.endswith("/a.txt") for method, path, _, _ in nextcloud.requests if method == "PUT")
@@ -0,0 +1,167 @@
+from collections import deque
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import Request
+
+# Giới hạn cho field text (username, password, ...) trong form upload
+MAX_FIELD_SIZE = 64 * 1024
+
+# Giới hạn cho field "paths" (danh sách đường dẫn) của /upload-many
+MAX_MANIFEST_SIZE = 4 * 1024 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+def clean_relative_path(path: str) -> str:
+    """
+    "photos\\2024/./a.jpg" -> "photos/2024/a.jpg"
+    Không cho phép ".." hay đường dẫn rỗng.
+    """
+    segments = [seg for seg in path.replace("\\", "/").split("/") if seg and seg != "."]
+    if not segments or ".." in segments:
+        raise UploadError(400, f"Invalid file path: {path}")
+    return "/".join(segments)
+
+
+class Part:
+    def __init__(self, stream, name: str, filename, content_type):
+        self._stream = stream
+        self._finished = False
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+
+    async def chunks(self):
+        while not self._finished:
+            event = await self._stream._next_event()
+            if event is None:
+                raise UploadError(400, "Unexpected end of multipart body")
+            kind, value = event
+            if kind == "data":
+                yield value
+            elif kind == "end":
+                self._finished = True
+
+    async def read(self, limit: int = MAX_FIELD_SIZE) -> bytes:
+        data = bytearray()
+        async for chunk in self.chunks():
+            data += chunk
+            if len(data) > limit:
+                raise UploadError(413, f"Field '{self.name}' is too large")
+        return bytes(data)
+
+    async def drain(self):
+        async for _ in self.chunks():
+            pass
+
+
+class MultipartStream:
+    """
+    Đọc multipart/form-data theo từng part, ngay khi body tới.
+    Khác với UploadFile của FastAPI (đọc hết body trước khi vào handler),
+    handler có thể kiểm tra các field đứng trước file rồi mới đọc file.
+    """
+
+    def __init__(self, request: Request):
+        content_type, params = parse_options_header(request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            raise UploadError(400, "Expected multipart/form-data")
+
+        content_length = request.headers.get("content-length")
+        self.content_length = int(content_length) if content_length and content_length.isdigit() else None
+        self.bytes_read = 0
+
+        self._request_stream = request.stream().__aiter__()
+        self._events = deque()
+        self._headers = {}
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._done = False
+        self._complete = False
+
+        self._parser = MultipartParser(params[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_end": self._on_end,
+        })
+
+    # --- parser callbacks ---
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field.clear()
+        self._header_value.clear()
+
+    def _on_headers_finished(self):
+        self._events.append(("headers", self._headers))
+
+    def _on_part_data(self, data, start, end):
+        self._events.append(("data", bytes(data[start:end])))
+
+    def _on_part_end(self):
+        self._events.append(("end", None))
+
+    def _on_end(self):
+        # Đã gặp boundary kết thúc: body đầy đủ
+        self._complete = True
+
+    async def _next_event(self):
+        while not self._events:
+            if self._done:
+                return None
+            try:
+                chunk = await self._request_stream.__anext__()
+            except StopAsyncIteration:
+                self._parser.finalize()
+                self._done = True
+                continue
+            self.bytes_read += len(chunk)
+            self._parser.write(chunk)
+        return self._events.popleft()
+
+    async def parts(self):
+        """
+        Async iterator các Part theo đúng thứ tự trong body.
+        Part trước phải được đọc xong (hoặc bỏ qua) trước khi lấy part sau.
+        """
+        current = None
+        while True:
+            if current is not None and not current._finished:
+                await current.drain()
+
+            event = await self._next_event()
+            if event is None:
+                if not self._complete:
+                    raise UploadError(400, "Unexpected end of multipart body")
+                return
+            kind, headers = event
+            if kind != "headers":
+                continue
+
+            _, options = parse_options_header(headers.get(b"content-disposition", b""))
+            filename = options.get(b"filename")
+            current = Part(
+                self,
+                name=options.get(b"name", b"").decode("utf-8"),
+                filename=filename.decode("utf-8") if filename is not None else None,
+                content_type=headers.get(b"content-type", b"application/octet-stream").decode("latin-1"),
+            )
+            yield current
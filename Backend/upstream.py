@@ -0,0 +1,140 @@
+import logging
+import time
+from http.cookiejar import DefaultCookiePolicy
+from threading import Lock
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import settings
+
+# Số kết nối giữ sẵn tới Nextcloud cho mỗi session
+POOL_SIZE = 32
+
+# Kiểm tra sẵn sàng: chờ Nextcloud tối đa bao lâu (giây)
+READY_TIMEOUT = 3
+
+logger = logging.getLogger("upstream")
+
+_admin_session = None
+_user_session = None
+_gateway_session = None
+_lock = Lock()
+
+
+def _loggable_url(url: str) -> str:
+    # Bỏ user:pass@ và query string (có thể chứa token)
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.hostname}{':' + str(parts.port) if parts.port else ''}{parts.path}"
+
+
+class LoggingAdapter(HTTPAdapter):
+    """
+    Ghi log mọi lệnh gọi ra ngoài: method, URL, status, thời gian tới khi
+    nhận header (body stream sau đó không tính). Không ghi header/auth.
+    """
+
+    def send(self, request, **kwargs):
+        fields = {"method": request.method, "url": _loggable_url(request.url)}
+        started = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+        except Exception as e:
+            logger.warning("upstream call failed", extra={
+                **fields,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                "error": f"{type(e).__name__}: {e}",
+            })
+            raise
+
+        logger.log(
+            logging.WARNING if response.status_code >= 500 else logging.INFO,
+            "upstream call",
+            extra={
+                **fields,
+                "status": response.status_code,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            }
+        )
+        return response
+
+
+def _new_session(pool_size: int) -> requests.Session:
+    session = requests.Session()
+    adapter = LoggingAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def admin_session() -> requests.Session:
+    """
+    Session dùng chung cho các lệnh OCS bằng tài khoản admin.
+    Giữ kết nối keep-alive (và cookie phiên của Nextcloud) giữa các request,
+    nên không phải bắt tay TLS + xác thực lại cho từng user khi tạo hàng loạt.
+    """
+    global _admin_session
+    if _admin_session is None:
+        with _lock:
+            if _admin_session is None:
+                session = _new_session(POOL_SIZE)
+                session.auth = (settings.NC_USERNAME, settings.NC_PASSWORD)
+                session.headers["OCS-APIRequest"] = "true"
+                _admin_session = session
+    return _admin_session
+
+
+def user_session() -> requests.Session:
+    """
+    Session dùng chung cho các request mang thông tin đăng nhập của user
+    (truyền auth= ở từng lệnh gọi). Chỉ dùng lại kết nối keep-alive:
+    cookie bị chặn để phiên Nextcloud của user này không bị gửi kèm
+    request của user khác.
+    """
+    global _user_session
+    if _user_session is None:
+        with _lock:
+            if _user_session is None:
+                session = _new_session(POOL_SIZE)
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                _user_session = session
+    return _user_session
+
+
+def gateway_session() -> requests.Session:
+    """
+    Session cho API của các cổng thanh toán (MoMo, ZaloPay).
+    """
+    global _gateway_session
+    if _gateway_session is None:
+        with _lock:
+            if _gateway_session is None:
+                session = _new_session(8)
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                _gateway_session = session
+    return _gateway_session
+
+
+def check_ready() -> dict:
+    """
+    Gọi status.php của Nextcloud qua pool kết nối dùng chung.
+    Trả về {"ok": bool, ...} cho endpoint /ready.
+    """
+    try:
+        r = user_session().get(f"{settings.NEXTCLOUD_URL}/status.php", timeout=READY_TIMEOUT)
+    except requests.RequestException as e:
+        return {"ok": False, "error": str(e)}
+
+    try:
+        status = r.json()
+    except ValueError:
+        status = {}
+
+    ok = r.status_code == 200 and status.get("installed", True) and not status.get("maintenance", False)
+    return {
+        "ok": bool(ok),
+        "status_code": r.status_code,
+        "maintenance": status.get("maintenance"),
+        "latency_ms": round(r.elapsed.total_seconds() * 1000, 1),
+    }
@@ -1,25 +1,30 @@
-import hmac
-import hashlib
-from urllib.parse import quote_plus
-from config import settings
+from pydantic_settings import BaseSettings
+
+from signing import get_signer, vnpay_canonical
+
+
+class VNPaySettings(BaseSettings):
+    VNPAY_TMNCODE: str
+    VNPAY_HASH_SECRET_KEY: str
+    VNPAY_PAYMENT_URL: str
+    VNPAY_RETURN_URL: str
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+
+settings = VNPaySettings()
 
 
 def create_vnpay_signature(params: dict) -> str:
-    hash_secret = settings.VNPAY_HASH_SECRET_KEY
-
-    # 1. sort params
-    sorted_params = sorted(params.items())
-
-    # 2. build query string (KHỚP 100% với URL)
-    query_string = "&".join(
-        f"{k}={quote_plus(str(v))}"
-        for k, v in sorted_params
-        if v is not None and v != "" and k not in ["vnp_SecureHash", "vnp_SecureHashType"]
-    )
-
-    # 3. sign
-    return hmac.new(
-        hash_secret.encode(),
-        query_string.encode(),
-        hashlib.sha512
-    ).hexdigest()
\ No newline at end of file
+    signer = get_signer(settings.VNPAY_HASH_SECRET_KEY, "sha512")
+    return signer.sign(vnpay_canonical(params))
+
+
+def verify_vnpay_signature(params: dict) -> bool:
+    """
+    Dùng cho return URL / IPN của VNPay
+    """
+    signer = get_signer(settings.VNPAY_HASH_SECRET_KEY, "sha512")
+    return signer.verify(vnpay_canonical(params), params.get("vnp_SecureHash"))
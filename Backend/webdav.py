@@ -0,0 +1,248 @@
+import asyncio
+import contextvars
+import queue
+import xml.etree.ElementTree as ET
+from urllib.parse import quote
+
+import requests
+from starlette.concurrency import run_in_threadpool
+
+from config import settings
+from upstream import user_session
+
+
+def dav_url(username: str, path: str = "") -> str:
+    """
+    URL WebDAV của path (chưa encode). Path được percent-encode ở đây:
+    "#", "?", "%" trong tên file không được lọt vào URL ở dạng thô.
+    """
+    return f"{settings.NEXTCLOUD_URL}/remote.php/dav/files/{quote(username)}/{quote(path.lstrip('/'))}"
+
+
+# Các prop dùng chung cho listing (list-files, dashboard, analytics)
+LISTING_PROPFIND = """
+    <d:propfind xmlns:d="DAV:" xmlns:oc="http://owncloud.org/ns">
+        <d:prop>
+            <d:getlastmodified />
+            <d:getcontentlength />
+            <d:getcontenttype />
+            <d:getetag />
+            <d:resourcetype />
+            <oc:size />
+        </d:prop>
+    </d:propfind>
+"""
+
+
+def propfind(username: str, auth, path: str = "", depth: str = "1", body: str = LISTING_PROPFIND):
+    headers = {
+        "Depth": depth,
+        "Content-Type": "application/xml"
+    }
+    return user_session().request("PROPFIND", dav_url(username, path), data=body, headers=headers, auth=auth)
+
+
+ETAG_PROPFIND = """
+    <d:propfind xmlns:d="DAV:">
+        <d:prop>
+            <d:getetag />
+        </d:prop>
+    </d:propfind>
+"""
+
+
+def probe_etag(username: str, auth, path: str = ""):
+    """
+    PROPFIND Depth 0 chỉ lấy ETag của folder. (status_code, etag)
+    """
+    r = propfind(username, auth, path, depth="0", body=ETAG_PROPFIND)
+    if r.status_code != 207:
+        return r.status_code, None
+    node = ET.fromstring(r.text).find(".//{DAV:}getetag")
+    return r.status_code, node.text if node is not None else None
+
+
+def relative_path(href: str, username: str) -> str:
+    """
+    "/remote.php/dav/files/test/Docs/a%20b.pdf" -> "/Docs/a b.pdf"
+    """
+    href = requests.utils.unquote(href)
+    marker = f"/remote.php/dav/files/{username}"
+    if marker in href:
+        href = href.split(marker, 1)[1]
+    return "/" + href.strip("/")
+
+
+def parse_listing(xml_text: str, username: str, folder: str = "/"):
+    """
+    Parse kết quả PROPFIND Depth 1.
+    Trả về (folder_entry, entries): entry của chính folder + các entry con.
+    """
+    root = ET.fromstring(xml_text)
+    folder = "/" + folder.strip("/")
+
+    folder_entry = None
+    entries = []
+
+    for resp in root.findall("{DAV:}response"):
+        href = resp.find("{DAV:}href").text
+        props = resp.find("{DAV:}propstat/{DAV:}prop")
+
+        def text(tag):
+            node = props.find(tag) if props is not None else None
+            return node.text if node is not None and node.text else None
+
+        resourcetype = props.find("{DAV:}resourcetype") if props is not None else None
+        is_folder = resourcetype is not None and resourcetype.find("{DAV:}collection") is not None
+        length = text("{DAV:}getcontentlength")
+        oc_size = text("{http://owncloud.org/ns}size")
+
+        entry = {
+            "href": href,
+            "path": relative_path(href, username),
+            "size": int(length) if length else 0,
+            "oc_size": int(oc_size) if oc_size else None,
+            "last_modified": text("{DAV:}getlastmodified"),
+            "type": text("{DAV:}getcontenttype"),
+            "etag": text("{DAV:}getetag"),
+            "is_folder": is_folder or text("{DAV:}getcontenttype") is None,
+        }
+
+        if entry["path"] == folder:
+            folder_entry = entry
+        else:
+            entries.append(entry)
+
+    return folder_entry, entries
+
+
+class _Abort:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_EOF = object()
+
+
+class UploadAborted(Exception):
+    pass
+
+
+async def _feed(q: queue.Queue, item, put_future) -> bool:
+    # Đưa chunk cho thread đang PUT; False nếu thread đã dừng (upstream đóng kết nối)
+    while True:
+        try:
+            q.put_nowait(item)
+            return True
+        except queue.Full:
+            if put_future.done():
+                return False
+            try:
+                await asyncio.to_thread(q.put, item, True, 0.5)
+                return True
+            except queue.Full:
+                continue
+
+
+async def put_stream(url: str, chunks, headers: dict, auth):
+    """
+    PUT dữ liệu từ async iterator `chunks` lên WebDAV mà không giữ cả file trong RAM.
+    requests chạy trong thread riêng, đọc chunk qua một queue có giới hạn.
+    Nếu `chunks` raise lỗi thì request upstream bị hủy và lỗi được raise lại.
+    """
+    q = queue.Queue(maxsize=8)
+
+    def body():
+        while True:
+            item = q.get()
+            if item is _EOF:
+                return
+            if isinstance(item, _Abort):
+                raise UploadAborted() from item.error
+            yield item
+
+    loop = asyncio.get_running_loop()
+    # copy_context: log của lệnh PUT vẫn mang request id của request gọi nó
+    put_future = loop.run_in_executor(
+        None,
+        contextvars.copy_context().run,
+        lambda: user_session().put(url, data=body(), headers=headers, auth=auth)
+    )
+
+    try:
+        async for chunk in chunks:
+            if chunk and not await _feed(q, chunk, put_future):
+                break
+        else:
+            await _feed(q, _EOF, put_future)
+    except BaseException as e:
+        await _feed(q, _Abort(e), put_future)
+        try:
+            await put_future
+        except Exception:
+            pass
+        raise
+
+    return await put_future
+
+
+class DavError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+def parent_folder(path: str) -> str:
+    """
+    "/a/b/c.txt" -> "/a/b", "/c.txt" -> ""
+    """
+    return path.rstrip("/").rpartition("/")[0]
+
+
+class FolderMaker:
+    """
+    Tạo folder bằng MKCOL cho một lần upload nhiều file.
+    - Mỗi folder chỉ MKCOL một lần dù nhiều file cùng nằm trong đó
+    - Folder cha luôn được tạo xong trước folder con
+    - Các nhánh khác nhau được tạo song song
+    """
+
+    def __init__(self, username: str, auth):
+        self.username = username
+        self.auth = auth
+        self._tasks = {}
+
+    def ensure(self, folder: str):
+        folder = folder.rstrip("/")
+        if not folder:
+            return _done()
+
+        task = self._tasks.get(folder)
+        if task is None:
+            task = asyncio.ensure_future(self._make(folder))
+            self._tasks[folder] = task
+        return task
+
+    async def _make(self, folder: str):
+        parent = parent_folder(folder)
+        if parent:
+            await self.ensure(parent)
+
+        r = await run_in_threadpool(
+            user_session().request, "MKCOL", dav_url(self.username, folder), auth=self.auth
+        )
+
+        # 405 = folder đã tồn tại
+        if r.status_code not in (201, 405):
+            raise DavError(r.status_code, f"Cannot create folder {folder}: {r.text}")
+
+    async def wait_all(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+
+def _done():
+    future = asyncio.get_running_loop().create_future()
+    future.set_result(None)
+    return future
@@ -1,35 +1,39 @@
-import hashlib
-import hmac
 from typing import Dict
 
+from pydantic_settings import BaseSettings
+
+from signing import get_signer, zalopay_canonical, ZALOPAY_CREATE_FIELDS
+
+
+class ZaloPaySettings(BaseSettings):
+    ZALOPAY_APP_ID: str
+    ZALOPAY_KEY1: str
+    ZALOPAY_KEY2: str
+    ZALOPAY_CREATE_ORDER_URL: str
+    ZALOPAY_RETURN_URL: str
+    ZALOPAY_CALLBACK_URL: str
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+
+settings = ZaloPaySettings()
+
 
 def generate_mac(data: str, key: str) -> str:
-    return hmac.new(
-        key.encode("utf-8"),
-        data.encode("utf-8"),
-        hashlib.sha256
-    ).hexdigest()
+    return get_signer(key, "sha256").sign(data)
 
 
 def create_order_mac(order: Dict, key1: str) -> str:
     """
     Dùng cho API create order
     """
-    data = "|".join([
-        str(order["app_id"]),
-        order["app_trans_id"],
-        order["app_user"],
-        str(order["amount"]),
-        str(order["app_time"]),
-        order["embed_data"],
-        order["item"],
-    ])
-    return generate_mac(data, key1)
+    return generate_mac(zalopay_canonical(order, ZALOPAY_CREATE_FIELDS), key1)
 
 
 def verify_callback_mac(data: str, mac: str, key2: str) -> bool:
     """
     Dùng cho callback từ ZaloPay
     """
-    calculated_mac = generate_mac(data, key2)
-    return calculated_mac == mac
\ No newline at end of file
+    return get_signer(key2, "sha256").verify(data, mac)
\ No newline at end of file